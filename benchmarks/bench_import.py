@@ -0,0 +1,84 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Import time of ocp_vscode
+
+Every run imports ocp_vscode in a fresh interpreter. Fails when the import pulls
+in OCP, ocp_tessellate or requests, which are loaded on the first show call, or
+when the median import time exceeds --max-ms:
+
+    python benchmarks/bench_import.py --runs 10 --max-ms 500
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# modules that must not be loaded by "import ocp_vscode"
+HEAVY = ("OCP", "ocp_tessellate", "requests")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import ocp_vscode
+from ocp_vscode import set_port, Animation
+duration = time.perf_counter() - start
+print(json.dumps({"seconds": duration, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def measure(runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--max-ms", type=float, default=500, help="limit for the median import time"
+    )
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    times = [result["seconds"] * 1000 for result in results]
+    loaded = sorted({m for result in results for m in result["loaded"]})
+    median = statistics.median(times)
+
+    print(
+        "import ocp_vscode: median %.1f ms, min %.1f ms, max %.1f ms (%d runs)"
+        % (median, min(times), max(times), len(times))
+    )
+
+    failed = False
+    if loaded:
+        print(f"FAILED: import ocp_vscode loads {', '.join(loaded)}")
+        failed = True
+    if median > args.max_ms:
+        print(f"FAILED: median import time exceeds {args.max_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Benchmark of the tessellate - serialize - send pipeline of show
+
+Every case runs in a fresh process, so caches are cold and the peak RSS
+belongs to the case alone. Models are sent to a local stub server instead of
+VS Code, so this runs headless:
+
+    python benchmarks/bench_pipeline.py --sizes 10,100,1000 --output results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import urllib.request
+from queue import Empty
+
+from stub_server import start_server
+
+# Profile stages of show, see ocp_vscode/profile.py
+TESSELLATE = ("to_assembly", "tessellate instances", "tessellate", "bb")
+SERIALIZE = ("create data obj", "hash meshes", "binary encode", "json dumps")
+SEND = ("query mesh cache", "http send")
+
+
+def _sum(stages, names):
+    return sum(stages.get(name, 0.0) for name in names)
+
+
+def run_case(workload, n, port, binary, quantize, parallel, repeat, queue):
+    from ocp_tessellate.tessellator import cache
+    from ocp_vscode import set_port, show
+    from models import WORKLOADS
+
+    set_port(port)
+    objs = WORKLOADS[workload](n)
+
+    best = None
+    for _ in range(repeat):
+        # every run starts with a cold tessellation cache and no meshes in the viewer
+        cache.clear()
+        urllib.request.urlopen(
+            urllib.request.Request(f"http://127.0.0.1:{port}", method="DELETE")
+        ).close()
+        profile = show(
+            *objs,
+            progress=None,
+            binary=binary,
+            quantize=quantize,
+            parallel=parallel,
+            profile=True,
+        )
+        if best is None or sum(profile.stages.values()) < sum(best.stages.values()):
+            best = profile
+
+    # Linux reports kilobytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put(
+        {
+            "workload": workload,
+            "parts": n,
+            "tessellate": _sum(best.stages, TESSELLATE),
+            "serialize": _sum(best.stages, SERIALIZE),
+            "send": _sum(best.stages, SEND),
+            "triangles": sum(part["triangles"] for part in best.parts),
+            "payload": best.payload,
+            "pool": best.pool,
+            "peak_rss": rss,
+            "stages": best.stages,
+        }
+    )
+
+
+def run(workloads, sizes, binary=True, quantize=False, parallel=False, repeat=1):
+    server = start_server()
+    port = server.server_address[1]
+    ctx = multiprocessing.get_context("spawn")
+
+    results = []
+    for workload in workloads:
+        for n in sizes:
+            queue = ctx.Queue()
+            process = ctx.Process(
+                target=run_case,
+                args=(workload, n, port, binary, quantize, parallel, repeat, queue),
+            )
+            process.start()
+            while True:
+                try:
+                    result = queue.get(timeout=1)
+                    break
+                except Empty:
+                    if not process.is_alive():
+                        result = None
+                        break
+            process.join()
+            if result is None:
+                print(f"{workload} with {n} parts failed", file=sys.stderr)
+                continue
+            if parallel and result["pool"] == 0:
+                print(
+                    f"{workload} with {n} parts: no part was tessellated in the pool",
+                    file=sys.stderr,
+                )
+            report(result, header=not results)
+            results.append(result)
+
+    server.shutdown()
+    return results
+
+
+def report(result, header=False):
+    if header:
+        print(
+            "%-10s %6s %6s %10s %10s %10s %12s %10s %10s %10s"
+            % (
+                "workload",
+                "parts",
+                "pool",
+                "tess [s]",
+                "ser [s]",
+                "send [s]",
+                "parts/s",
+                "MB",
+                "MB/s",
+                "RSS [MB]",
+            )
+        )
+    mb = result["payload"] / 1024 / 1024
+    print(
+        "%-10s %6d %6d %10.3f %10.3f %10.3f %12.1f %10.2f %10.1f %10.1f"
+        % (
+            result["workload"],
+            result["parts"],
+            result["pool"],
+            result["tessellate"],
+            result["serialize"],
+            result["send"],
+            result["parts"] / max(result["tessellate"], 1e-9),
+            mb,
+            mb / max(result["serialize"] + result["send"], 1e-9),
+            result["peak_rss"] / 1024 / 1024,
+        ),
+        flush=True,
+    )
+
+
+def main():
+    from models import WORKLOADS
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--workloads",
+        default=",".join(WORKLOADS),
+        help="comma separated list of %s" % ", ".join(WORKLOADS),
+    )
+    parser.add_argument(
+        "--sizes", default="10,100,1000,5000", help="comma separated part counts"
+    )
+    parser.add_argument("--wire", choices=("binary", "json"), default="binary")
+    parser.add_argument(
+        "--quantize", action="store_true", help="compact meshes, binary wire only"
+    )
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best run")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(
+        args.workloads.split(","),
+        [int(n) for n in args.sizes.split(",")],
+        binary=args.wire == "binary",
+        quantize=args.quantize,
+        parallel=args.parallel,
+        repeat=args.repeat,
+    )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "wire": args.wire,
+                    "quantize": args.quantize,
+                    "parallel": args.parallel,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
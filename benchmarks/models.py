@@ -0,0 +1,71 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Synthetic workloads of scaling size for the benchmarks
+
+Every workload returns the list of objects to pass to show for n parts.
+"""
+
+import math
+
+import cadquery as cq
+
+
+def _grid(i, n, spacing):
+    columns = math.ceil(math.sqrt(n))
+    return (i % columns) * spacing, (i // columns) * spacing, 0
+
+
+def instances(n):
+    """One assembly with n references to the same solid (tessellated once)"""
+    part = cq.Workplane().box(8, 8, 4).edges("|Z").fillet(1).faces(">Z").hole(3)
+    assy = cq.Assembly(name="instances")
+    for i in range(n):
+        assy.add(part, name=f"part_{i}", loc=cq.Location(cq.Vector(*_grid(i, n, 10))))
+    return [assy]
+
+
+def unique(n):
+    """n different solids as flat list (every solid gets tessellated)"""
+    parts = []
+    for i in range(n):
+        height = 2 + (i % 97) / 10
+        parts.append(
+            cq.Workplane()
+            .box(8, 8, height)
+            .edges("|Z")
+            .fillet(1 + (i % 7) / 10)
+            .translate(_grid(i, n, 10))
+        )
+    return parts
+
+
+def curved(n):
+    """n different tori and spheres, high curvature means many triangles"""
+    parts = []
+    for i in range(n):
+        x, y, z = _grid(i, n, 10)
+        if i % 2 == 0:
+            solid = cq.Solid.makeTorus(3 + (i % 11) / 10, 1, pnt=cq.Vector(x, y, z))
+        else:
+            solid = cq.Solid.makeSphere(
+                3 + (i % 13) / 10, pnt=cq.Vector(x, y, z), angleDegrees1=-90
+            )
+        parts.append(cq.Workplane().add(solid))
+    return parts
+
+
+WORKLOADS = {"instances": instances, "unique": unique, "curved": curved}
@@ -0,0 +1,159 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Stand-in for the command server of the VS Code extension (src/controller.ts)
+
+Accepts the same requests, i.e. kept alive connections, chunked and gzip
+encoded bodies and the X-OCP-Timings header, but drops the models after
+reading them. Like the mesh cache of the viewer it remembers the hashes of the
+meshes it received, answers /hashes with the known ones and rejects messages
+with unknown hash only meshes. DELETE forgets all hashes.
+
+Can be started standalone: python benchmarks/stub_server.py [port]
+"""
+
+import json
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Accept-Encoding", "gzip")
+        self.send_header("X-OCP-Features", "hashes")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_DELETE(self):
+        # not part of the command server, lets the benchmark empty the mesh cache
+        self.server.hashes.clear()
+        self._respond(b"done", "text/plain", 200)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        decompressor = None
+        if self.headers.get("Content-Encoding") == "gzip":
+            decompressor = zlib.decompressobj(wbits=31)
+
+        chunks = []
+        for chunk in self._chunks():
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+        body = b"".join(chunks)
+
+        if self.path == "/hashes":
+            known = [h for h in json.loads(body) if h in self.server.hashes]
+            self._respond(json.dumps(known).encode(), "application/json", 200)
+            return
+
+        self.server.received += len(body)
+
+        missing = self._add_meshes(body)
+        if missing:
+            self._respond(
+                json.dumps({"missing": missing}).encode(), "application/json", 409
+            )
+        elif self.headers.get("X-OCP-Timings") is not None:
+            timings = {"receive": (time.perf_counter() - start) * 1000}
+            self._respond(json.dumps(timings).encode(), "application/json")
+        else:
+            self._respond(b"done", "text/plain")
+
+    def _chunks(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                remaining -= len(chunk)
+                yield chunk
+
+    def _add_meshes(self, body):
+        """Remember the hashes of the meshes of a binary message, see
+        ocp_vscode/binary.py, and return the unknown ones sent as hash only"""
+        if body[:4] != b"OCPB":
+            return []
+        (length,) = struct.unpack("<I", body[4:8])
+        data = json.loads(body[8 : 8 + length]).get("data")
+        if not isinstance(data, dict):
+            return []
+
+        meshes = list(data.get("instances", []))
+
+        def walk(obj):
+            if "parts" in obj:
+                for part in obj["parts"]:
+                    walk(part)
+            elif obj.get("type") == "shapes" and "hash" in obj.get("shape", {}):
+                meshes.append(obj["shape"])
+
+        walk(data.get("shapes", {}))
+
+        missing = []
+        for mesh in meshes:
+            if "hash" not in mesh:
+                continue
+            if "vertices" in mesh:
+                self.server.hashes.add(mesh["hash"])
+            elif mesh["hash"] not in self.server.hashes:
+                missing.append(mesh["hash"])
+        return missing
+
+    def _respond(self, body, content_type, status=201):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0):
+    """Start the stub server in a daemon thread, port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.received = 0
+    # hashes of the meshes received so far, the stand-in for the mesh cache
+    server.hashes = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 3939
+    server = start_server(port)
+    print(f"Stub command server listening on port {server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
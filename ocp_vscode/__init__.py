@@ -1,3 +1,60 @@
-from .show import show, show_object, reset_show, set_port
+from .show import (
+    show,
+    show_async,
+    show_object,
+    show_config,
+    reset_show,
+    set_port,
+    save_scene,
+    load_scene,
+)
+from .profile import Profile
+from .comms import set_transport
 from .animation import Animation
-from  ocp_tessellate import set_defaults, reset_defaults, get_defaults, get_default
+from .export import export_scene
+from .viewer import Viewer
+from .session import Session
+
+# Loaded on first access, since ocp_tessellate imports OCP (see show.py)
+_LAZY = {
+    "shutdown_pool": "ocp_vscode.parallel",
+    "enable_disk_cache": "ocp_vscode.disk_cache",
+    "disable_disk_cache": "ocp_vscode.disk_cache",
+    "clear_disk_cache": "ocp_vscode.disk_cache",
+    "set_defaults": "ocp_tessellate",
+    "reset_defaults": "ocp_tessellate",
+    "get_defaults": "ocp_tessellate",
+    "get_default": "ocp_tessellate",
+}
+
+__all__ = [
+    "show",
+    "show_async",
+    "show_object",
+    "show_config",
+    "reset_show",
+    "set_port",
+    "Profile",
+    "set_transport",
+    "Animation",
+    "export_scene",
+    "save_scene",
+    "load_scene",
+    "Viewer",
+    "Session",
+    *_LAZY,
+]
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
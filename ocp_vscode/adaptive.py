@@ -0,0 +1,215 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Tolerances adapted to the part size, see show(..., adaptive=True)
+
+ocp_tessellate derives the linear deflection of a part from the part's own
+bounding box, so a small screw gets as fine a mesh relative to its size as the
+whole frame it sits in. In adaptive mode the deviation of an instance is scaled
+by the square root of the ratio of scene size and instance size, i.e. parts much
+smaller than the scene get coarser meshes. With a triangle budget all
+tolerances are scaled further until the scene fits into the budget.
+"""
+
+import math
+
+from OCP.gp import gp_Pnt
+
+from ocp_tessellate import cad_objects
+from ocp_tessellate.cad_objects import OCP_PartGroup
+from ocp_tessellate.ocp_utils import BoundingBox, bounding_box
+from ocp_tessellate.tessellator import compute_quality, tessellate
+from ocp_tessellate.utils import round_sig
+
+from .parallel import tessellate_instances
+
+# Upper limit for coarsening an instance because of its size
+MAX_FACTOR = 20
+
+# Upper limit for the angular tolerance (radians) of coarsened instances
+MAX_ANGULAR_TOLERANCE = 0.8
+
+# Tessellation rounds to fit into the triangle budget
+MAX_ITERATIONS = 4
+
+
+def _size(bb):
+    return bb.xsize + bb.ysize + bb.zsize
+
+
+def _moved(bb, loc):
+    if loc is None:
+        return bb
+    trsf = loc.Transformation()
+    corners = [
+        gp_Pnt(x, y, z).Transformed(trsf)
+        for x in (bb.xmin, bb.xmax)
+        for y in (bb.ymin, bb.ymax)
+        for z in (bb.zmin, bb.zmax)
+    ]
+    xs = [p.X() for p in corners]
+    ys = [p.Y() for p in corners]
+    zs = [p.Z() for p in corners]
+    return BoundingBox(
+        {
+            "xmin": min(xs),
+            "xmax": max(xs),
+            "ymin": min(ys),
+            "ymax": max(ys),
+            "zmin": min(zs),
+            "zmax": max(zs),
+        }
+    )
+
+
+def _combine(loc, other):
+    if loc is None:
+        return other
+    return loc if other is None else loc * other
+
+
+def analyse(part_group):
+    """Return the local bounding box and reference count of every instance
+    and the bounding box of the whole scene"""
+    bbs, refs = {}, {}
+    scene = None
+
+    def walk(obj, loc):
+        nonlocal scene
+
+        loc = _combine(loc, obj.loc)
+        if isinstance(obj, OCP_PartGroup):
+            for child in obj.objects:
+                walk(child, loc)
+            return
+
+        if isinstance(obj.shape, dict):
+            index = obj.shape["ref"]
+            if index not in bbs:
+                shape = cad_objects.INSTANCES[index].shape
+                bbs[index] = bounding_box([shape], optimal=False)
+            refs[index] = refs.get(index, 0) + 1
+            bb = _moved(bbs[index], loc)
+        else:
+            bb = bounding_box(obj.shape, loc=loc, optimal=False)
+
+        if scene is None:
+            scene = BoundingBox(bb)
+        else:
+            scene.update(bb)
+
+    walk(part_group, None)
+
+    for index, instance in enumerate(cad_objects.INSTANCES):
+        if index not in bbs:
+            bbs[index] = bounding_box([instance.shape], optimal=False)
+
+    return bbs, refs, scene
+
+
+def scene_size(part_group):
+    """Size of the scene the tolerances of its instances get adapted to"""
+    scene = analyse(part_group)[2]
+    return None if scene is None else round_sig(_size(scene), 3)
+
+
+def tolerances(bbs, scene, deviation, angular_tolerance, scale=1.0):
+    """Map instance indexes to (deviation, angular_tolerance) adapted to their size"""
+    result = {}
+    scene_size = _size(scene)
+    for index, bb in bbs.items():
+        size = _size(bb)
+        factor = 1.0 if size <= 0 else min(math.sqrt(scene_size / size), MAX_FACTOR)
+        factor = max(1.0, factor) * scale
+        result[index] = (
+            round_sig(deviation * factor, 3),
+            # triangles grow with 1 / deviation, but with 1 / angular_tolerance^2
+            min(
+                round_sig(angular_tolerance * math.sqrt(factor), 3),
+                MAX_ANGULAR_TOLERANCE,
+            ),
+        )
+    return result
+
+
+def _tessellate_serial(tols, bbs, render_edges, progress):
+    for index, instance in enumerate(cad_objects.INSTANCES):
+        if instance.mesh is not None:
+            continue
+        deviation, angular_tolerance = tols[index]
+        instance.quality = compute_quality(bbs[index], deviation=deviation)
+        instance.mesh = tessellate(
+            [instance.shape],
+            deviation=deviation,
+            quality=instance.quality,
+            angular_tolerance=angular_tolerance,
+            compute_edges=render_edges,
+            progress=progress,
+        )
+
+
+def triangle_count(refs):
+    return sum(
+        len(cad_objects.INSTANCES[index].mesh["triangles"]) // 3 * count
+        for index, count in refs.items()
+    )
+
+
+def tessellate_adaptive(
+    part_group,
+    deviation,
+    angular_tolerance,
+    render_edges,
+    triangle_budget=None,
+    parallel=False,
+    progress=None,
+    profile=None,
+):
+    """Tessellate the instances of part_group with tolerances adapted to their size
+
+    Meshes are stored in the instances, so that tessellate_group only needs to
+    tessellate the remaining edges and vertices. Returns the number of triangles
+    of all instance references.
+    """
+    bbs, refs, scene = analyse(part_group)
+    if not bbs:
+        return 0
+
+    scale = 1.0
+    for iteration in range(MAX_ITERATIONS):
+        if iteration > 0:
+            for instance in cad_objects.INSTANCES:
+                instance.mesh = None
+
+        tols = tolerances(bbs, scene, deviation, angular_tolerance, scale)
+        if parallel:
+            jobs = tessellate_instances(
+                deviation, angular_tolerance, render_edges, progress, tolerances=tols
+            )
+            if profile is not None:
+                profile.add_pool(jobs)
+        else:
+            _tessellate_serial(tols, bbs, render_edges, progress)
+
+        triangles = triangle_count(refs)
+        if triangle_budget is None or triangles <= triangle_budget:
+            return triangles
+
+        # triangles grow roughly linear with 1 / deviation
+        scale *= triangles / triangle_budget
+
+    print(f"{triangles} triangles do not fit into the budget of {triangle_budget}")
+    return triangles
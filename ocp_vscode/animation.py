@@ -1,8 +1,17 @@
-import json
-
-from ocp_tessellate.utils import numpy_to_json
+import numpy as np
+
+from .keyframes import (
+    angle_error,
+    continuous,
+    decimate,
+    position_error,
+    to_positions_quaternions,
+)
 from .show import _send
 
+# number of values per keyframe, the other actions have one
+WIDTHS = {"t": 3, "q": 4}
+
 
 class Animation:
     def __init__(self, assembly):
@@ -11,7 +20,8 @@ class Animation:
             assembly, "fq_name"
         )
         self.is_alg123d = hasattr(assembly, "mates") and hasattr(assembly, "fq_name")
-        self.paths = list(assembly.objects.keys())
+        # a set, since large simulations add thousands of tracks
+        self.paths = set(assembly.objects.keys())
 
     def add_track(self, path, action, times, values):
         """
@@ -29,10 +39,10 @@ class Animation:
             - "t" to add a position vector (3-dim array) to the current position of the CAD object
             - "rx", "ry", "rz" for rotations around x, y or z-axis
             - "q" to apply a quaternion to the location of the CAD object
-        times : list of float or int
+        times : list or numpy array of float or int
             An array of floats describing the points in time where CAD object (with id `path`) should be at the location
             defined by `action` and `values`
-        values : list of float or int
+        values : list or numpy array of float or int
             An array of same length as `times` defining the locations where the CAD objects should be according to the
             `action` provided. Formats:
 
@@ -72,13 +82,23 @@ class Animation:
         # if path[0] != "/":
         #     path = f"/{path}"
 
+        times = np.asarray(times, dtype=np.float32)
+        values = np.asarray(values, dtype=np.float32)
+
         if len(times) != len(values):
             raise ValueError("Parameters 'times' and 'values' need to have same length")
 
+        width = WIDTHS.get(action, 1)
+        if times.ndim != 1 or values.shape[1:] != ((width,) if width > 1 else ()):
+            raise ValueError(
+                f"Action '{action}' needs a list of times and a list of "
+                + (f"{width}-dim values" if width > 1 else "numbers")
+            )
+
         if self.is_cadquery:
             root, _, cq_path = path.strip("/").partition("/")
 
-            if root not in self.paths or cq_path not in self.paths + [""]:
+            if root not in self.paths or (cq_path != "" and cq_path not in self.paths):
                 raise ValueError(f"Path '{path}' does not exist in assembly")
 
         elif self.is_alg123d:
@@ -87,6 +107,89 @@ class Animation:
 
         self.tracks.append((path, action, times, values))
 
-    def animate(self, speed):
+    def sample(
+        self,
+        fn,
+        duration,
+        fps=30,
+        tolerance=0.01,
+        angular_tolerance=0.001,
+        vectorized=False,
+    ):
+        """
+        Adding translation and rotation tracks sampled from a kinematics function.
+
+        Parameters
+        ----------
+        fn : callable
+            Called with a time in seconds, returns a dict mapping paths to locations.
+            A location is relative to the location of the CAD object in the shown
+            assembly and can be
+
+            - a tuple (position, quaternion), with quaternions of the form (x,y,z,w)
+            - a 3-dim position, without rotation
+            - a 4x4 transformation matrix
+            - a build123d or CadQuery Location, an OCP TopLoc_Location or gp_Trsf
+        duration : float
+            Length of the animation in seconds
+        fps : int or float
+            Samples per second
+        tolerance : float
+            Keyframes that linear interpolation of the positions reproduces within this
+            distance get dropped
+        angular_tolerance : float
+            Keyframes that slerp of the quaternions reproduces within this angle
+            (radians) get dropped
+        vectorized : bool
+            If True, fn is called once with a numpy array of all times and returns
+            positions (n, 3), tuples (positions (n, 3), quaternions (n, 4)) or
+            matrices (n, 4, 4) per path
+
+        Examples
+        --------
+        ```
+        def crank(t):
+            angle = 2 * np.pi * t
+            return {
+                "/mechanism/crank": ((0, 0, 0), (0, 0, np.sin(angle / 2), np.cos(angle / 2))),
+                "/mechanism/slider": (np.cos(angle) * 10, 0, 0),
+            }
+
+        animation.sample(crank, duration=4, fps=60)
+        ```
+        """
+        times = np.arange(round(duration * fps) + 1) / fps
+        n = len(times)
+
+        if vectorized:
+            sampled = {
+                path: to_positions_quaternions(value, n)
+                for path, value in fn(times).items()
+            }
+        else:
+            frames = [fn(t) for t in times]
+            sampled = {}
+            for path in frames[0]:
+                locations = [to_positions_quaternions(f[path], 1) for f in frames]
+                sampled[path] = (
+                    np.concatenate([p for p, _ in locations]),
+                    np.concatenate([q for _, q in locations]),
+                )
+
+        for path, (positions, quaternions) in sampled.items():
+            # tracks without motion would only cost upload and playback time
+            if np.linalg.norm(positions, axis=1).max() > tolerance:
+                keep = decimate(times, positions, position_error, tolerance)
+                self.add_track(path, "t", times[keep], positions[keep])
+
+            quaternions = continuous(quaternions)
+            if (2 * np.arccos(np.clip(np.abs(quaternions[:, 3]), 0, 1))).max() > (
+                angular_tolerance
+            ):
+                keep = decimate(times, quaternions, angle_error, angular_tolerance)
+                self.add_track(path, "q", times[keep], quaternions[keep])
+
+    def animate(self, speed, port=None):
+        # times and values are sent as float32 buffers of the binary wire format
         data = {"data": self.tracks, "type": "animation", "config": {"speed": speed}}
-        _send(json.loads(numpy_to_json(data)))
+        _send(data, port=port, binary=True)
@@ -0,0 +1,220 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Binary wire format for messages to the viewer
+
+    | "OCPB" | header length (uint32 LE) | JSON header | padding | blobs ... |
+
+The JSON header is the message where every float numpy array is replaced by
+{"shape", "dtype", "offset", "length"}, with offset being relative to the start
+of the blob section. Blobs are little endian and 8 byte aligned, so that the
+webview can wrap them as typed arrays without copying.
+
+With quantize=True meshes get a compact encoding, decoded in src/display.ts:
+- vertices and edges: uint16 relative to the bounding box of the mesh,
+  the mesh gets "quantization": {"offset": [x, y, z], "scale": [x, y, z]}
+  and a value is offset + q * scale
+- normals: octahedral encoding, 2 x int16 per normal
+- triangles: uint16 for meshes with less than 65536 vertices, else uint32
+
+Meshes can carry a "hash" of their content. The command server of the extension
+caches these meshes, and meshes it already has get sent as {"hash": ...} only,
+see comms.known_hashes and src/cache.ts.
+"""
+
+import hashlib
+import struct
+
+import numpy as np
+import orjson as json
+
+MAGIC = b"OCPB"
+ALIGN = 8
+
+
+def _padding(size):
+    return b"\x00" * ((-size) % ALIGN)
+
+
+def quantize_positions(values, offset, scale):
+    q = np.rint((values.reshape(-1, 3) - offset) / scale)
+    return np.clip(q, 0, 65535).astype(np.uint16).ravel()
+
+
+def octahedral(normals):
+    """Encode unit normals as 2 x int16 on the octahedron"""
+    n = normals.reshape(-1, 3).astype(np.float64)
+    length = np.abs(n).sum(axis=1, keepdims=True)
+    n = n / np.where(length == 0, 1.0, length)
+    x, y, z = n[:, 0], n[:, 1], n[:, 2]
+    sign_x = np.where(x >= 0, 1.0, -1.0)
+    sign_y = np.where(y >= 0, 1.0, -1.0)
+    # fold the lower hemisphere over the diagonals
+    u = np.where(z < 0, (1 - np.abs(y)) * sign_x, x)
+    v = np.where(z < 0, (1 - np.abs(x)) * sign_y, y)
+    return np.rint(np.stack([u, v], axis=1) * 32767).astype(np.int16).ravel()
+
+
+def quantize_mesh(mesh):
+    """Return a compact copy of a mesh dict of ocp_tessellate"""
+    vertices = mesh["vertices"].reshape(-1, 3)
+    edges = mesh.get("edges")
+    points = vertices
+    if isinstance(edges, np.ndarray) and edges.size > 0:
+        points = np.concatenate([vertices, edges.reshape(-1, 3)])
+    if len(points) == 0:
+        return mesh
+
+    low = points.min(axis=0).astype(np.float64)
+    high = points.max(axis=0).astype(np.float64)
+    scale = np.where(high > low, (high - low) / 65535, 1.0)
+
+    result = dict(mesh)
+    result["quantization"] = {"offset": low.tolist(), "scale": scale.tolist()}
+    result["vertices"] = quantize_positions(vertices, low, scale)
+    if isinstance(edges, np.ndarray):
+        result["edges"] = quantize_positions(edges, low, scale)
+    if isinstance(mesh.get("normals"), np.ndarray):
+        result["normals"] = octahedral(mesh["normals"])
+    dtype = np.uint16 if len(vertices) < 65536 else np.uint32
+    result["triangles"] = np.asarray(mesh["triangles"], dtype=dtype).ravel()
+    return result
+
+
+def has_instances(data):
+    return isinstance(data.get("data"), dict) and "instances" in data["data"]
+
+
+def map_meshes(data, fn):
+    """Copy of a data, update or refine message with fn applied to every mesh
+
+    Meshes are the instances and the leaves of type "shapes" not referencing one.
+    They are shared with the tessellation cache, so fn must not change them.
+    """
+
+    def walk(obj):
+        if obj.get("type") == "shapes" and "vertices" in obj["shape"]:
+            return {**obj, "shape": fn(obj["shape"])}
+        if "parts" in obj:
+            return {**obj, "parts": [walk(part) for part in obj["parts"]]}
+        return obj
+
+    mesh_data = dict(data["data"])
+    mesh_data["instances"] = [fn(mesh) for mesh in mesh_data["instances"]]
+    if "shapes" in mesh_data:
+        mesh_data["shapes"] = walk(mesh_data["shapes"])
+    return {**data, "data": mesh_data}
+
+
+def quantize_message(data):
+    """Copy of a data, update or refine message with quantized meshes"""
+    return map_meshes(data, quantize_mesh)
+
+
+def mesh_hash(mesh, quantize=False):
+    """Content hash of a mesh dict as it will be sent"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(b"quantized" if quantize else b"float")
+    for key in sorted(mesh):
+        value = mesh[key]
+        h.update(key.encode())
+        if isinstance(value, np.ndarray):
+            h.update(str(value.dtype).encode())
+            h.update(str(value.shape).encode())
+            h.update(np.ascontiguousarray(value).data)
+        else:
+            h.update(json.dumps(value, option=json.OPT_SERIALIZE_NUMPY))
+    return h.hexdigest()
+
+
+def hash_meshes(data, quantize=False):
+    """Copy of a data, update or refine message with a "hash" in every mesh"""
+    return map_meshes(data, lambda mesh: {**mesh, "hash": mesh_hash(mesh, quantize)})
+
+
+def mesh_hashes(data):
+    hashes = []
+
+    def collect(mesh):
+        if "hash" in mesh:
+            hashes.append(mesh["hash"])
+        return mesh
+
+    if has_instances(data):
+        map_meshes(data, collect)
+    return hashes
+
+
+def numpy_to_buffers(value):
+    """Replace float numpy arrays by references into a list of blobs"""
+    blobs = []
+    offset = 0
+
+    def walk(obj):
+        nonlocal offset
+
+        if isinstance(obj, np.ndarray):
+            if str(obj.dtype) in ("int32", "int64", "uint64"):
+                return obj.tolist()
+
+            obj = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<")).ravel()
+            ref = {
+                "shape": obj.shape,
+                "dtype": str(obj.dtype),
+                "offset": offset,
+                "length": obj.nbytes,
+            }
+            blobs.append(memoryview(obj).cast("B"))
+            padding = _padding(obj.nbytes)
+            if padding:
+                blobs.append(padding)
+            offset += obj.nbytes + len(padding)
+            return ref
+
+        elif isinstance(obj, (tuple, list)):
+            return [walk(el) for el in obj]
+
+        elif isinstance(obj, dict):
+            rv = {}
+            for k, v in obj.items():
+                rv[k] = walk(v)
+            return rv
+
+        else:
+            return obj
+
+    return walk(value), blobs
+
+
+def to_binary(data, quantize=False, known=()):
+    """Encode a message as list of byte chunks in the binary wire format
+
+    Meshes with a hash in known are replaced by {"hash": ...}
+    """
+    if has_instances(data):
+        if quantize:
+            data = quantize_message(data)
+        if known:
+            data = map_meshes(
+                data,
+                lambda mesh: (
+                    {"hash": mesh["hash"]} if mesh.get("hash") in known else mesh
+                ),
+            )
+    header, blobs = numpy_to_buffers(data)
+    header = json.dumps(header)
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    return [prefix, _padding(len(prefix)), *blobs]
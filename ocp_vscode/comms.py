@@ -0,0 +1,221 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Transport of messages to the command server of the viewer
+
+Connections are kept alive per thread and bodies are uploaded with chunked
+transfer encoding from the list of chunks the message was encoded to, so the
+body never exists as one large bytes object. Optionally the body is gzip
+compressed, if the command server announces it accepts gzip, and a Unix domain
+socket can be used instead of TCP.
+
+The command server keeps the meshes it received in a cache, known_hashes asks
+which of them it still has, see binary.py.
+"""
+
+import http.client
+import json
+import os
+import socket
+import threading
+import zlib
+from collections import namedtuple
+
+# Upper limit for the size of a chunk of the http body
+CHUNK_SIZE = 1024 * 1024
+
+COMPRESSIONS = ("gzip",)
+
+COMPRESSION = None
+SOCKET = os.environ.get("OCP_VSCODE_SOCKET")
+
+Response = namedtuple("Response", ["status_code", "text", "headers"])
+
+_local = threading.local()
+_server_info = {}
+
+
+def set_transport(socket=None, compression=None):
+    """Configure how messages are sent to the viewer
+    Parameters
+    - socket:      Path of the Unix domain socket of the viewer, None uses TCP with the port of
+                   set_port (default=None, or the environment variable OCP_VSCODE_SOCKET)
+    - compression: Compress messages with "gzip" or not at all with None (default=None)
+    """
+    global SOCKET, COMPRESSION
+
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"compression needs to be one of None, {COMPRESSIONS}")
+
+    SOCKET = socket
+    COMPRESSION = compression
+    _server_info.clear()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+        self.connect_timeout = timeout
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.connect_timeout)
+        self.sock.connect(self.socket_path)
+        # large models can take long to transfer
+        self.sock.settimeout(None)
+
+
+def _session():
+    if getattr(_local, "session", None) is None:
+        # imported on first use to keep "import ocp_vscode" fast
+        import requests
+
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _unix_connection(timeout):
+    conn = getattr(_local, "unix_connection", None)
+    if conn is None or conn.socket_path != SOCKET:
+        if conn is not None:
+            conn.close()
+        conn = _UnixHTTPConnection(SOCKET, timeout)
+        _local.unix_connection = conn
+    return conn
+
+
+def _split(chunks):
+    for chunk in chunks:
+        chunk = memoryview(chunk).cast("B")
+        for start in range(0, len(chunk), CHUNK_SIZE):
+            yield chunk[start : start + CHUNK_SIZE]
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _counted(body):
+    # a retry sends the body again
+    _local.sent = 0
+    for chunk in body:
+        _local.sent += len(chunk)
+        yield chunk
+
+
+def _body(chunks, encoding):
+    if chunks is None:
+        return None
+    body = _split(chunks)
+    if encoding == "gzip":
+        body = _gzip(body)
+    return _counted(body)
+
+
+def _request(method, chunks, headers, port, timeout, encoding=None, path="/"):
+    if SOCKET is None:
+        r = _session().request(
+            method,
+            f"http://127.0.0.1:{port}{path}",
+            data=_body(chunks, encoding),
+            headers=headers,
+            # connect timeout only, large models can take long to transfer
+            timeout=(timeout, None),
+        )
+        return r
+
+    conn = _unix_connection(timeout)
+    for retry in (True, False):
+        try:
+            conn.request(
+                method,
+                path,
+                body=_body(chunks, encoding),
+                headers=headers or {},
+                encode_chunked=chunks is not None,
+            )
+            r = conn.getresponse()
+            return Response(r.status, r.read().decode(), r.headers)
+
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            # the server closed the kept alive connection in the meantime
+            conn.close()
+            if not retry:
+                raise
+
+
+def _info(port, timeout):
+    """Encodings and features the command server announces in its GET response"""
+    address = port if SOCKET is None else SOCKET
+    if address not in _server_info:
+        r = _request("GET", None, None, port, timeout)
+        _server_info[address] = {
+            key: {
+                value.strip()
+                for value in r.headers.get(header, "").split(",")
+                if value.strip()
+            }
+            for key, header in (
+                ("encodings", "Accept-Encoding"),
+                ("features", "X-OCP-Features"),
+            )
+        }
+    return _server_info[address]
+
+
+def features(port, timeout):
+    return _info(port, timeout)["features"]
+
+
+def known_hashes(hashes, port, timeout):
+    """Return the subset of the mesh hashes the command server has cached"""
+    if not hashes or "hashes" not in features(port, timeout):
+        return set()
+
+    r = _request(
+        "POST",
+        [json.dumps(list(hashes)).encode()],
+        {"Content-Type": "application/json"},
+        port,
+        timeout,
+        path="/hashes",
+    )
+    if r.status_code != 200:
+        return set()
+    return set(json.loads(r.text))
+
+
+def send(chunks, content_type, port, timeout, headers=None):
+    """Post the message given as list of byte chunks to the viewer"""
+    headers = {"Content-Type": content_type, **(headers or {})}
+
+    encoding = None
+    if COMPRESSION is not None and COMPRESSION in _info(port, timeout)["encodings"]:
+        encoding = COMPRESSION
+        headers["Content-Encoding"] = encoding
+
+    return _request("POST", chunks, headers, port, timeout, encoding)
+
+
+def sent_bytes():
+    """Size of the body of the last send of this thread, after compression"""
+    return getattr(_local, "sent", 0)
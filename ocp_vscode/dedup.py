@@ -0,0 +1,201 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Instancing of geometrically identical shapes, see show(..., dedup=True)
+
+ocp_tessellate only shares the mesh of shapes with the same TShape, i.e. copies
+of one shape. Parts that were built separately, e.g. a bolt created in a loop,
+get tessellated and sent once per part. Here the BReps of all solids of a show
+call are compared up to their location: identical ones become references to one
+instance, so the viewer receives one mesh and a transform per part.
+
+All remaining parts with faces then become instances of their own, since the
+disk cache, the tessellation pool, adaptive tolerances and level of detail
+work on the instances of ocp_tessellate.
+"""
+
+from collections import OrderedDict
+
+from OCP.TopLoc import TopLoc_Location
+
+from ocp_tessellate import cad_objects
+from ocp_tessellate.cad_objects import Instance, OCP_Part, OCP_PartGroup, make_compound
+from ocp_tessellate.ocp_utils import bounding_box
+from ocp_tessellate.tessellator import MAX_HASH_KEY
+from ocp_tessellate.utils import round_sig
+
+from .utils import shape_hash
+
+# canonical shapes and compounds by hash codes, least recently used first, see
+# _canonical and _compound
+_CANONICAL = OrderedDict()
+
+# canonical shapes kept for later show calls, each keeps its BRep alive
+MAX_CANONICAL = 16384
+
+
+def _canonical(shape):
+    """The shape without location and its location
+
+    ocp_tessellate's cache keys contain id(shape), so a shape with the same
+    TShape and orientation as in a former show call gets the same canonical
+    shape object again. Otherwise its mesh would never be found in the cache.
+    """
+    canonical = shape.Located(TopLoc_Location())
+    key = canonical.HashCode(MAX_HASH_KEY)
+    shapes = _CANONICAL.pop(key, [])
+    known = next((s for s in shapes if s.IsEqual(canonical)), None)
+    if known is None:
+        shapes.append(canonical)
+    else:
+        canonical = known
+    _CANONICAL[key] = shapes
+
+    while len(_CANONICAL) > MAX_CANONICAL:
+        _CANONICAL.popitem(last=False)
+
+    return canonical, shape.Location()
+
+
+def _compound(shapes):
+    """A compound of shapes, the same object for equal shapes as in former calls"""
+    key = tuple(shape.HashCode(MAX_HASH_KEY) for shape in shapes)
+    compounds = _CANONICAL.pop(key, [])
+    compound = next(
+        (
+            compound
+            for members, compound in compounds
+            if all(a.IsEqual(b) for a, b in zip(members, shapes))
+        ),
+        None,
+    )
+    if compound is None:
+        compound = make_compound(shapes)
+        compounds.append((list(shapes), compound))
+    _CANONICAL[key] = compounds
+
+    while len(_CANONICAL) > MAX_CANONICAL:
+        _CANONICAL.popitem(last=False)
+
+    return compound
+
+
+def _signature(shape):
+    # cheap pre-selection, only shapes with equal signatures get serialized
+    bb = bounding_box([shape], optimal=False)
+    return (
+        shape.ShapeType(),
+        round_sig(bb.xsize, 6),
+        round_sig(bb.ysize, 6),
+        round_sig(bb.zsize, 6),
+    )
+
+
+def dedup_instances(part_group):
+    """Merge instances and solids of part_group with identical BRep
+
+    Needs to be called right after to_assembly, before anything got tessellated.
+    Locations of the shapes move into the referencing parts. Returns a tuple
+    (references, meshes): the number of parts referencing an instance and the
+    number of instances left to tessellate.
+    """
+    instances = cad_objects.INSTANCES
+    leaves = []  # (part, canonical shape, shape location, instance index or None)
+
+    def walk(obj):
+        if isinstance(obj, OCP_PartGroup):
+            for child in obj.objects:
+                walk(child)
+
+        elif isinstance(obj.shape, dict):
+            index = obj.shape["ref"]
+            leaves.append((obj, *_canonical(instances[index].shape), index))
+
+        # faces, edges and vertices are subclasses of OCP_Part
+        elif type(obj) is OCP_Part and len(obj.shape) == 1:
+            leaves.append((obj, *_canonical(obj.shape[0]), None))
+
+    walk(part_group)
+
+    candidates = {}
+    for leaf in leaves:
+        candidates.setdefault(_signature(leaf[1]), []).append(leaf)
+
+    groups = {}
+    for key, group in candidates.items():
+        if len(group) == 1:
+            groups[key] = group
+            continue
+        hashes = {}
+        for leaf in group:
+            index = leaf[3]
+            if index is not None and index in hashes:
+                # same TShape, no need to serialize again
+                digest = hashes[index]
+            else:
+                digest = shape_hash(leaf[1])
+                if index is not None:
+                    hashes[index] = digest
+            groups.setdefault(digest, []).append(leaf)
+
+    shapes, references = [], 0
+    for group in groups.values():
+        if len(group) == 1 and group[0][3] is None:
+            # a single non instance solid, nothing to share
+            continue
+
+        for part, _, location, _ in group:
+            part.loc = location if part.loc is None else part.loc * location
+            part.shape = {"ref": len(shapes)}
+        shapes.append(group[0][1])
+        references += len(group)
+
+    # unreferenced instances would only get tessellated in vain
+    cad_objects.set_instances(shapes)
+
+    return references, len(shapes)
+
+
+def instance_parts(part_group):
+    """Turn the parts of part_group that do not reference an instance into instances
+
+    Needs to be called after dedup_instances, before anything got tessellated.
+    The meshes of plain objects, e.g. a flat list of workplanes, then take the
+    same paths as the ones of assemblies. Returns the number of new instances.
+    """
+    instances = cad_objects.INSTANCES
+    count = len(instances)
+
+    def walk(obj):
+        if isinstance(obj, OCP_PartGroup):
+            for child in obj.objects:
+                walk(child)
+
+        # OCP_Faces is a subclass of OCP_Part, edges and vertices are not
+        elif (
+            isinstance(obj, OCP_Part)
+            and not isinstance(obj.shape, dict)
+            and len(obj.shape) > 0
+        ):
+            shape = obj.shape[0] if len(obj.shape) == 1 else _compound(obj.shape)
+            shape, location = _canonical(shape)
+            obj.loc = location if obj.loc is None else obj.loc * location
+            obj.shape = {"ref": len(instances)}
+            instances.append(Instance(shape))
+
+    walk(part_group)
+
+    return len(instances) - count
@@ -0,0 +1,166 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Persistent tessellation cache
+
+Every mesh is stored in its own folder as .npy files (memory mapped when loaded)
+plus the tessellation quality. The folder name is a hash of the BRep and the
+tessellation parameters. The folder mtime is used for LRU eviction.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from ocp_tessellate import cad_objects
+
+from .utils import shape_hash
+
+ARRAYS = ("vertices", "triangles", "normals", "edges")
+
+DISK_CACHE = None
+
+
+class DiskCache:
+    def __init__(self, cache_dir, max_size_mb):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(
+        self,
+        shape,
+        deviation,
+        angular_tolerance,
+        edge_accuracy,
+        render_edges,
+        adaptive=None,
+    ):
+        # adaptive: what the adapted tolerances depend on besides the shape, or None
+        params = f"{deviation}|{angular_tolerance}|{edge_accuracy}|{render_edges}"
+        if adaptive is not None:
+            params += f"|{adaptive}"
+        h = hashlib.blake2b(params.encode(), digest_size=8).hexdigest()
+        return f"{shape_hash(shape)}-{h}"
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as fd:
+                meta = json.load(fd)
+            mesh = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ARRAYS
+            }
+            # mark as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return mesh, meta["quality"]
+
+    def put(self, key, mesh, quality):
+        path = os.path.join(self.cache_dir, key)
+        if os.path.exists(path):
+            return
+
+        # write into a temp folder and rename, so that readers never see partial entries
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(mesh[name]))
+            with open(os.path.join(tmp, "meta.json"), "w") as fd:
+                json.dump({"quality": quality}, fd)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name.startswith(".tmp-"):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.cache_dir):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def enable_disk_cache(cache_dir=None, max_size_mb=1024):
+    """Persist tessellation results across Python processes
+    Parameters
+    - cache_dir:         Folder for the cache, defaults to $OCP_VSCODE_CACHE_DIR or ~/.cache/ocp_vscode
+    - max_size_mb:       Size budget, least recently used meshes get removed beyond it (default=1024)
+    """
+    global DISK_CACHE
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "OCP_VSCODE_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "ocp_vscode"),
+        )
+    DISK_CACHE = DiskCache(cache_dir, max_size_mb)
+
+
+def disable_disk_cache():
+    global DISK_CACHE
+    DISK_CACHE = None
+
+
+def clear_disk_cache():
+    if DISK_CACHE is not None:
+        DISK_CACHE.clear()
+
+
+def load_instances(params, progress=None):
+    """Fill the meshes of the current instances from the disk cache
+
+    Returns the cache keys of the instances, None for the ones found on disk
+    """
+    keys = []
+    for instance in cad_objects.INSTANCES:
+        key = DISK_CACHE.key(instance.shape, *params)
+        result = DISK_CACHE.get(key)
+        if result is None:
+            keys.append(key)
+        else:
+            instance.mesh, instance.quality = result
+            keys.append(None)
+            if progress is not None:
+                progress.update("c")
+    return keys
+
+
+def store_instances(keys, meshes):
+    """Store the newly tessellated meshes of the current instances"""
+    for key, mesh, instance in zip(keys, meshes, cad_objects.INSTANCES):
+        if key is not None and isinstance(mesh, dict):
+            DISK_CACHE.put(key, mesh, instance.quality)
+    DISK_CACHE.evict()
@@ -0,0 +1,310 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Export of tessellated scenes to binary glTF (GLB), see export_scene
+
+The part tree becomes the node tree, every instance one set of accessors
+shared by all parts referencing it, and every color and alpha one material.
+Faces are triangles, edges lines and vertices points. The layout of the binary
+chunk is computed upfront, so the arrays of the tessellation get written to
+the file one after the other, without joining them in memory.
+"""
+
+import struct
+
+import numpy as np
+import orjson as json
+
+from .show import Progress, _tessellate
+
+GLB_MAGIC = b"glTF"
+JSON_CHUNK = 0x4E4F534A
+BIN_CHUNK = 0x004E4942
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+FLOAT = 5126
+UNSIGNED_INT = 5125
+
+POINTS = 0
+LINES = 1
+TRIANGLES = 4
+
+# glTF is y up, CAD models are usually z up
+Z_UP = [-(0.5**0.5), 0.0, 0.0, 0.5**0.5]
+
+
+def _padding(size, fill=b"\x00"):
+    return fill * ((-size) % 4)
+
+
+def _linear(color, alpha=1.0):
+    """sRGB web color "#rrggbb" to a linear glTF color factor"""
+    if isinstance(color, (list, tuple)):
+        # one color per edge or vertex, glTF has one per primitive
+        color = color[0]
+    srgb = np.array([int(color[i : i + 2], 16) / 255 for i in (1, 3, 5)])
+    linear = np.where(
+        srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4
+    ).tolist()
+    return linear + [alpha]
+
+
+class _Gltf:
+    def __init__(self):
+        self.json = {
+            "asset": {"version": "2.0", "generator": "ocp_vscode"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [],
+            "meshes": [],
+            "materials": [],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": [],
+        }
+        self.arrays = []
+        self.length = 0
+        self.materials = {}
+        self.meshes = {}
+        self.instances = {}
+
+    def accessor(self, array, type_, target, bounds=False):
+        array = np.ascontiguousarray(array)
+        # bufferViews start at multiples of 4, as glTF requires
+        self.json["bufferViews"].append(
+            {
+                "buffer": 0,
+                "byteOffset": self.length,
+                "byteLength": array.nbytes,
+                "target": target,
+            }
+        )
+        self.arrays.append(array)
+        self.length += array.nbytes + len(_padding(array.nbytes))
+
+        accessor = {
+            "bufferView": len(self.json["bufferViews"]) - 1,
+            "componentType": UNSIGNED_INT if array.dtype == np.uint32 else FLOAT,
+            "count": len(array),
+            "type": type_,
+        }
+        if bounds and len(array) > 0:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        self.json["accessors"].append(accessor)
+        return len(self.json["accessors"]) - 1
+
+    def positions(self, values):
+        values = np.asarray(values, dtype="<f4").reshape(-1, 3)
+        return self.accessor(values, "VEC3", ARRAY_BUFFER, bounds=True)
+
+    def mesh_accessors(self, mesh):
+        """Accessors of the faces and edges of a mesh of ocp_tessellate"""
+        if len(mesh["triangles"]) == 0:
+            return {}
+        accessors = {
+            "POSITION": self.positions(mesh["vertices"]),
+            "NORMAL": self.accessor(
+                np.asarray(mesh["normals"], dtype="<f4").reshape(-1, 3),
+                "VEC3",
+                ARRAY_BUFFER,
+            ),
+            "indices": self.accessor(
+                np.asarray(mesh["triangles"]).astype("<u4", copy=False).ravel(),
+                "SCALAR",
+                ELEMENT_ARRAY_BUFFER,
+            ),
+        }
+        edges = mesh.get("edges")
+        if isinstance(edges, np.ndarray) and edges.size > 0:
+            accessors["edges"] = self.positions(edges)
+        return accessors
+
+    def material(self, color, alpha=1.0, renderback=False, unlit=False):
+        key = (str(color), alpha, renderback, unlit)
+        if key not in self.materials:
+            material = {
+                "pbrMetallicRoughness": {
+                    "baseColorFactor": _linear(color, alpha),
+                    "metallicFactor": 0.0,
+                    "roughnessFactor": 0.7,
+                },
+                "doubleSided": renderback,
+            }
+            if alpha < 1:
+                material["alphaMode"] = "BLEND"
+            if unlit:
+                material["extensions"] = {"KHR_materials_unlit": {}}
+                self.json["extensionsUsed"] = ["KHR_materials_unlit"]
+            self.json["materials"].append(material)
+            self.materials[key] = len(self.json["materials"]) - 1
+        return self.materials[key]
+
+    def mesh(self, key, primitives):
+        # parts with the same instance and color share one glTF mesh
+        if key not in self.meshes:
+            self.json["meshes"].append({"primitives": primitives})
+            self.meshes[key] = len(self.json["meshes"]) - 1
+        return self.meshes[key]
+
+    def node(self, obj):
+        node = {"name": obj.get("name", "")}
+        loc = obj.get("loc")
+        if loc is not None:
+            node["translation"] = list(loc[0])
+            node["rotation"] = list(loc[1])
+        self.json["nodes"].append(node)
+        return node, len(self.json["nodes"]) - 1
+
+    def write(self, path):
+        header = json.dumps(self.json)
+        header += _padding(len(header), b" ")
+        length = 12 + 8 + len(header) + 8 + self.length
+        with open(path, "wb") as f:
+            f.write(GLB_MAGIC + struct.pack("<II", 2, length))
+            f.write(struct.pack("<II", len(header), JSON_CHUNK))
+            f.write(header)
+            f.write(struct.pack("<II", self.length, BIN_CHUNK))
+            for array in self.arrays:
+                f.write(memoryview(array).cast("B"))
+                f.write(_padding(array.nbytes))
+
+
+def _leaf(gltf, obj, instances, states, config):
+    node, index = gltf.node(obj)
+    faces, edges = states.get(obj["id"], [1, 1])
+    node["extras"] = {"id": obj["id"], "state": [faces, edges]}
+
+    primitives = []
+    if obj["type"] == "shapes":
+        ref = obj["shape"].get("ref")
+        mesh_key = ("instance", ref) if ref is not None else ("shape", index)
+        if mesh_key not in gltf.instances:
+            mesh = instances[ref] if ref is not None else obj["shape"]
+            gltf.instances[mesh_key] = gltf.mesh_accessors(mesh)
+        accessors = gltf.instances[mesh_key]
+
+        if faces == 1 and "indices" in accessors:
+            material = gltf.material(
+                obj["color"], obj.get("alpha", 1.0), obj.get("renderback", False)
+            )
+            primitives.append(
+                {
+                    "attributes": {
+                        "POSITION": accessors["POSITION"],
+                        "NORMAL": accessors["NORMAL"],
+                    },
+                    "indices": accessors["indices"],
+                    "material": material,
+                    "mode": TRIANGLES,
+                }
+            )
+        if edges == 1 and "edges" in accessors:
+            material = gltf.material(config["default_edgecolor"], unlit=True)
+            primitives.append(
+                {
+                    "attributes": {"POSITION": accessors["edges"]},
+                    "material": material,
+                    "mode": LINES,
+                }
+            )
+        key = (mesh_key, tuple(p["material"] for p in primitives))
+
+    elif edges == 1 and len(obj["shape"]) > 0:
+        # edges (n, 2, 3) and vertices (n, 3) of the part tree
+        material = gltf.material(obj["color"], unlit=True)
+        primitives.append(
+            {
+                "attributes": {"POSITION": gltf.positions(obj["shape"])},
+                "material": material,
+                "mode": LINES if obj["type"] == "edges" else POINTS,
+            }
+        )
+        key = ("leaf", index)
+
+    if primitives:
+        node["mesh"] = gltf.mesh(key, primitives)
+    return index
+
+
+def _group(gltf, obj, instances, states, config):
+    if "parts" not in obj:
+        return _leaf(gltf, obj, instances, states, config)
+
+    node, index = gltf.node(obj)
+    node["extras"] = {"id": obj.get("id")}
+    children = [_group(gltf, part, instances, states, config) for part in obj["parts"]]
+    if children:
+        node["children"] = children
+    return index
+
+
+def export_scene(
+    *cad_objs,
+    path,
+    names=None,
+    colors=None,
+    alphas=None,
+    progress="-+c",
+    **kwargs,
+):
+    """Tessellate CAD objects and write them to a binary glTF (.glb) file
+    Parameters
+    - cad_objs:          All cad objects that should be exported as positional parameters
+
+    Keywords for export_scene:
+    - path:              The path of the .glb file
+    - names:             List of names for the cad_objs. Needs to have the same length as cad_objs
+    - colors:            List of colors for the cad_objs. Needs to have the same length as cad_objs
+    - alphas:            List of alpha values for the cad_objs. Needs to have the same length as cad_objs
+    - progress:          Show progress of tessellation with None is no progress indicator. (default="-+c")
+                         for object: "-": is reference, "+": gets tessellated, "c": from cache
+
+    Valid keywords (**kwargs) are the tessellation keywords of show, e.g. deviation,
+    angular_tolerance, render_edges, parallel, adaptive and dedup, and
+    - up:                Use z-axis ('Z') or y-axis ('Y') as up direction, a z up model gets
+                         rotated into the y up convention of glTF (default='Z')
+    - default_edgecolor: Default edge color (default="#707070")
+
+    The node tree follows the part tree of the viewer. The nodes have "extras" with
+    the id of the object in the viewer, leaves additionally with its state
+    [faces, edges]. Hidden faces and edges are not exported.
+    """
+    from ocp_tessellate.utils import Color
+
+    if kwargs.get("default_edgecolor") is not None:
+        kwargs["default_edgecolor"] = Color(kwargs["default_edgecolor"]).web_color
+
+    instances, shapes, states, config, _ = _tessellate(
+        *cad_objs,
+        names=names,
+        colors=colors,
+        alphas=alphas,
+        progress=Progress([] if progress is None else [c for c in progress]),
+        **kwargs,
+    )
+
+    gltf = _Gltf()
+    root = {"name": "root"}
+    if config.get("up", "Z") == "Z":
+        root["rotation"] = Z_UP
+    gltf.json["nodes"].append(root)
+    root["children"] = [_group(gltf, shapes, instances, states, config)]
+
+    gltf.json["buffers"].append({"byteLength": gltf.length})
+    gltf.write(path)
@@ -0,0 +1,197 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Keyframes from sampled locations, see Animation.sample
+
+Locations get converted to positions and quaternions (x, y, z, w). Keyframes
+are then decimated: a keyframe is dropped when linear interpolation of the
+positions and slerp of the quaternions between the kept neighbours, as three.js
+does when playing the tracks, reproduces it within the tolerances.
+"""
+
+import numpy as np
+
+IDENTITY = np.array([0.0, 0.0, 0.0, 1.0])
+
+
+def matrix_to_quaternion(m):
+    """Quaternions (n, 4) of the rotation parts of matrices (n, 3+, 3+)"""
+    m = np.asarray(m, dtype=np.float64)
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+    trace = m00 + m11 + m22
+
+    # choose the numerically most stable of the four formulas per matrix
+    candidates = np.stack(
+        [
+            np.stack(
+                [
+                    m[:, 2, 1] - m[:, 1, 2],
+                    m[:, 0, 2] - m[:, 2, 0],
+                    m[:, 1, 0] - m[:, 0, 1],
+                    1 + trace,
+                ],
+                axis=1,
+            ),
+            np.stack(
+                [
+                    1 + m00 - m11 - m22,
+                    m[:, 0, 1] + m[:, 1, 0],
+                    m[:, 0, 2] + m[:, 2, 0],
+                    m[:, 2, 1] - m[:, 1, 2],
+                ],
+                axis=1,
+            ),
+            np.stack(
+                [
+                    m[:, 0, 1] + m[:, 1, 0],
+                    1 - m00 + m11 - m22,
+                    m[:, 1, 2] + m[:, 2, 1],
+                    m[:, 0, 2] - m[:, 2, 0],
+                ],
+                axis=1,
+            ),
+            np.stack(
+                [
+                    m[:, 0, 2] + m[:, 2, 0],
+                    m[:, 1, 2] + m[:, 2, 1],
+                    1 - m00 - m11 + m22,
+                    m[:, 1, 0] - m[:, 0, 1],
+                ],
+                axis=1,
+            ),
+        ]
+    )
+    choice = np.argmax(np.stack([trace, m00, m11, m22]), axis=0)
+    q = candidates[choice, np.arange(len(m))]
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def _from_trsf(trsf):
+    p = trsf.TranslationPart()
+    q = trsf.GetRotation()
+    return (p.X(), p.Y(), p.Z()), (q.X(), q.Y(), q.Z(), q.W())
+
+
+def to_positions_quaternions(value, n):
+    """Convert n locations to positions (n, 3) and quaternions (n, 4)
+
+    value is one of
+    - a tuple (positions, quaternions) or a tuple (position, quaternion) for n=1
+    - positions (n, 3) or a position (3,), without rotation
+    - 4x4 matrices (n, 4, 4) or a matrix (4, 4)
+    - a location of build123d or CadQuery, an OCP TopLoc_Location or gp_Trsf
+      for n=1
+    """
+    value = getattr(value, "wrapped", value)
+    if hasattr(value, "Transformation"):
+        value = value.Transformation()
+    if hasattr(value, "TranslationPart"):
+        value = _from_trsf(value)
+
+    if isinstance(value, tuple) and len(value) == 2:
+        positions = np.asarray(value[0], dtype=np.float64).reshape(n, 3)
+        quaternions = np.asarray(value[1], dtype=np.float64).reshape(n, 4)
+        norm = np.linalg.norm(quaternions, axis=1, keepdims=True)
+        return positions, quaternions / np.where(norm == 0, 1.0, norm)
+
+    value = np.asarray(value, dtype=np.float64)
+    if value.shape[-2:] == (4, 4):
+        matrices = value.reshape(n, 4, 4)
+        return matrices[:, :3, 3].copy(), matrix_to_quaternion(matrices)
+    if value.shape[-1] == 3:
+        return value.reshape(n, 3), np.tile(IDENTITY, (n, 1))
+
+    raise ValueError(f"Cannot convert {value!r} to locations")
+
+
+def continuous(quaternions):
+    """Flip signs, so that consecutive quaternions are in the same hemisphere"""
+    signs = np.where(np.sum(quaternions[1:] * quaternions[:-1], axis=1) < 0, -1, 1)
+    signs = np.concatenate([[1], np.cumprod(signs)])
+    return quaternions * signs[:, None]
+
+
+def slerp(a, b, u):
+    """Spherical interpolation from quaternions a (n, 4) to b (n, 4) at fractions u"""
+    dot = np.sum(a * b, axis=1)
+    # the shorter way, as three.js does
+    b = np.where((dot < 0)[:, None], -b, b)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, 0, 1))
+    sin = np.sin(theta)
+    # nearly equal quaternions get interpolated linearly
+    close = dot > 0.9995
+    sin = np.where(close, 1.0, sin)
+    wa = np.where(close, 1 - u, np.sin((1 - u) * theta) / sin)
+    wb = np.where(close, u, np.sin(u * theta) / sin)
+    q = wa[:, None] * a + wb[:, None] * b
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def _fractions(times, i, j, k):
+    return (times[k] - times[i]) / (times[j] - times[i])
+
+
+def position_error(times, positions, i, j, k):
+    """Distance of keyframes k to the linear interpolation of keyframes i and j"""
+    u = _fractions(times, i, j, k)
+    d = positions[k] - positions[i] - u[:, None] * (positions[j] - positions[i])
+    return np.sqrt(np.einsum("ij,ij->i", d, d))
+
+
+def angle_error(times, quaternions, i, j, k):
+    """Angle between keyframes k and the slerp of keyframes i and j"""
+    expected = slerp(quaternions[i], quaternions[j], _fractions(times, i, j, k))
+    dot = np.abs(np.einsum("ij,ij->i", quaternions[k], expected))
+    return 2 * np.arccos(np.clip(dot, 0, 1))
+
+
+def decimate(times, values, error, tolerance):
+    """Indexes of the keyframes to keep (Ramer-Douglas-Peucker)
+
+    error(times, values, i, j, k) returns the errors of keyframes k when
+    interpolating between keyframes i and j. All segments of one subdivision
+    level are handled in one call.
+    """
+    n = len(times)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    starts, ends = np.array([0]), np.array([n - 1])
+    while len(starts) > 0:
+        lengths = ends - starts - 1
+        inner = lengths > 0
+        starts, ends, lengths = starts[inner], ends[inner], lengths[inner]
+        if len(starts) == 0:
+            break
+
+        # the keyframes between start and end of every segment
+        offsets = np.cumsum(lengths) - lengths
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        k = starts[segment] + 1 + np.arange(lengths.sum()) - offsets[segment]
+        errors = error(times, values, starts[segment], ends[segment], k)
+
+        # split the segments at their keyframe with the largest error
+        maxima = np.maximum.reduceat(errors, offsets)
+        candidates = np.flatnonzero(errors == maxima[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        split = maxima > tolerance
+        worst = k[candidates[first]][split]
+        keep[worst] = True
+        starts = np.concatenate([starts[split], worst])
+        ends = np.concatenate([worst, ends[split]])
+
+    return np.flatnonzero(keep)
@@ -0,0 +1,151 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Level of detail tessellation, see show(..., lod=True)
+
+The instances (solids and faces) of the scene are first tessellated with coarse
+tolerances and sent, then they get refined with the requested tolerances in the
+background, largest first, and the refined meshes are sent as "refine" messages
+that replace the meshes of the leaves referencing them. Edges and vertices are
+never refined, so they get the requested tolerances right away.
+"""
+
+import threading
+import time
+
+from ocp_tessellate import cad_objects
+from ocp_tessellate.ocp_utils import bounding_box
+from ocp_tessellate.tessellator import compute_quality, tessellate
+
+from .show import _LOCK as _tessellation_lock
+
+# coarse meshes use a LOD_FACTOR times larger deviation and angular tolerance ...
+LOD_FACTOR = 10
+
+# ... with the angular tolerance (radians) capped to keep round shapes recognizable
+MAX_COARSE_ANGULAR_TOLERANCE = 0.8
+
+_lock = threading.Lock()
+_generation = 0
+
+
+def coarse_tolerances(deviation, angular_tolerance):
+    return (
+        deviation * LOD_FACTOR,
+        min(angular_tolerance * LOD_FACTOR, MAX_COARSE_ANGULAR_TOLERANCE),
+    )
+
+
+def tessellate_coarse(deviation, angular_tolerance, render_edges, progress=None):
+    """Tessellate the instances without a mesh with the coarse tolerances
+
+    Meshes are stored in the instances, so that tessellate_group only needs to
+    tessellate the remaining edges and vertices with the requested tolerances.
+    """
+    for instance in cad_objects.INSTANCES:
+        if instance.mesh is not None:
+            continue
+        bb = bounding_box([instance.shape], optimal=False)
+        instance.quality = compute_quality(bb, deviation=deviation)
+        instance.mesh = tessellate(
+            [instance.shape],
+            deviation=deviation,
+            quality=instance.quality,
+            angular_tolerance=angular_tolerance,
+            compute_edges=render_edges,
+            progress=progress,
+        )
+
+
+def cancel_refinement():
+    """Stop a running refinement, e.g. since a new scene gets shown"""
+    global _generation
+
+    with _lock:
+        _generation += 1
+        return _generation
+
+
+def refinement_jobs(shapes):
+    """Collect the instances of the last tessellation and the leaves using them
+
+    Needs to be called right after tessellation, since the next to_assembly
+    replaces ocp_tessellate's instances. Returns a list of (shape, leaf ids)
+    sorted by size, largest first.
+    """
+    ids = {}
+
+    def walk(obj):
+        for part in obj.get("parts", []):
+            walk(part)
+        ref = obj.get("shape", {}).get("ref") if obj.get("type") == "shapes" else None
+        if ref is not None:
+            ids.setdefault(ref, []).append(obj["id"])
+
+    walk(shapes)
+
+    jobs = []
+    for index, leaf_ids in ids.items():
+        shape = cad_objects.INSTANCES[index].shape
+        bb = bounding_box([shape], optimal=False)
+        # shapes used more often take more room on the screen
+        size = max(bb.xsize, bb.ysize, bb.zsize) * len(leaf_ids)
+        jobs.append((size, shape, leaf_ids))
+
+    return [
+        (shape, leaf_ids) for _, shape, leaf_ids in sorted(jobs, key=lambda j: -j[0])
+    ]
+
+
+def refine(
+    jobs, generation, deviation, angular_tolerance, render_edges, send, interval
+):
+    """Tessellate the jobs with the requested tolerances and send the meshes
+
+    send(meshes, ids) is called every interval seconds with the meshes refined
+    so far. Stops as soon as cancel_refinement() was called after generation.
+    """
+    meshes, ids = [], []
+    last_send = time.time()
+    for shape, leaf_ids in jobs:
+        if generation != _generation:
+            return
+
+        # ocp_tessellate's cache is shared with show, see _LOCK
+        with _tessellation_lock:
+            bb = bounding_box([shape], optimal=False)
+            mesh = tessellate(
+                [shape],
+                deviation=deviation,
+                quality=compute_quality(bb, deviation=deviation),
+                angular_tolerance=angular_tolerance,
+                compute_edges=render_edges,
+            )
+        meshes.append(mesh)
+        ids.append(leaf_ids)
+
+        if time.time() - last_send > interval:
+            with _lock:
+                if generation != _generation:
+                    return
+                send(meshes, ids)
+            meshes, ids = [], []
+            last_send = time.time()
+
+    if meshes:
+        with _lock:
+            if generation == _generation:
+                send(meshes, ids)
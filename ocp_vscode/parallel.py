@@ -0,0 +1,215 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Long lived process pool for parallel tessellation
+
+The pool is started on first use and shared with ocp_tessellate's mp_tessellator.
+It stays alive across show() calls and gets shut down after POOL_IDLE_TIMEOUT
+seconds without use, by shutdown_pool() or at interpreter exit.
+
+tessellate_instances() distributes the instances over the pool. Since all parts
+with faces become instances, see dedup.instance_parts, this covers flat lists of
+objects as well as assemblies.
+"""
+
+import atexit
+import multiprocessing
+import threading
+
+from ocp_tessellate import cad_objects, mp_tessellator
+from ocp_tessellate.ocp_utils import bounding_box, deserialize, serialize
+from ocp_tessellate.tessellator import cache, compute_quality, make_key, tessellate
+
+# seconds, None keeps the pool alive until shutdown_pool() is called
+POOL_IDLE_TIMEOUT = 600
+
+# Serialized BRep size (bytes) below which shapes get batched into one task
+BATCH_SIZE = 256 * 1024
+
+_lock = threading.RLock()
+_timer = None
+_users = 0
+
+
+def _pool_size():
+    return max(1, int(multiprocessing.cpu_count() * 0.8))
+
+
+def _init_worker():
+    # import OCP and the tessellator once, when the worker starts
+    import ocp_tessellate.mp_tess  # pylint: disable=import-outside-toplevel,unused-import
+
+
+def _cancel_timer():
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+
+
+def _shutdown_idle(timer):
+    with _lock:
+        # ignore timers that were cancelled while waiting for the lock
+        if timer is _timer and _users == 0:
+            shutdown_pool()
+
+
+def get_pool():
+    """Return the tessellation pool, start it if needed"""
+    global _users
+
+    with _lock:
+        _cancel_timer()
+        _users += 1
+        if mp_tessellator.pool is None:
+            mp_tessellator.pool = multiprocessing.Pool(
+                _pool_size(), initializer=_init_worker
+            )
+        return mp_tessellator.pool
+
+
+def release_pool():
+    """Mark the pool as unused and schedule the idle shutdown"""
+    global _timer, _users
+
+    with _lock:
+        _users = max(0, _users - 1)
+        if _users == 0 and POOL_IDLE_TIMEOUT is not None:
+            _cancel_timer()
+            timer = threading.Timer(POOL_IDLE_TIMEOUT, lambda: _shutdown_idle(timer))
+            timer.daemon = True
+            _timer = timer
+            timer.start()
+
+
+def shutdown_pool():
+    """Stop the tessellation worker processes"""
+    with _lock:
+        _cancel_timer()
+        if mp_tessellator.pool is not None:
+            mp_tessellator.close_pool()
+
+
+def _tessellate_batch(batch):
+    """Runs in a worker: tessellate a batch of serialized shapes"""
+    result = []
+    for index, buffer, deviation, quality, angular_tolerance, render_edges in batch:
+        # bypass the cache of the worker: its keys use object ids and hash codes of
+        # the temporary deserialized shapes, which get reused after they are freed
+        mesh = tessellate.__wrapped__(
+            [deserialize(buffer)],
+            deviation=deviation,
+            quality=quality,
+            angular_tolerance=angular_tolerance,
+            compute_edges=render_edges,
+        )
+        result.append((index, mesh))
+    return result
+
+
+def _batches(jobs, batch_size):
+    """Big shapes form their own batch, small ones are grouped up to batch_size"""
+    batch, size = [], 0
+    for job in jobs:
+        job_size = len(job[1])
+        if job_size >= batch_size:
+            yield [job]
+            continue
+
+        batch.append(job)
+        size += job_size
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+
+    if batch:
+        yield batch
+
+
+def tessellate_instances(
+    deviation, angular_tolerance, render_edges, progress=None, tolerances=None
+):
+    """Tessellate all instances of the current assembly in the pool
+
+    Meshes are stored in the instances, already known meshes (disk cache or
+    tessellation cache of this process) are not tessellated again. tolerances
+    optionally maps instance indexes to their own (deviation, angular_tolerance).
+    Returns the number of instances tessellated in the pool.
+    """
+    jobs = []
+    keys = {}
+    for index, instance in enumerate(cad_objects.INSTANCES):
+        if instance.mesh is not None:
+            continue
+
+        instance_deviation, instance_angular_tolerance = (
+            (deviation, angular_tolerance) if tolerances is None else tolerances[index]
+        )
+
+        bb = bounding_box([instance.shape], optimal=False)
+        instance.quality = compute_quality(bb, deviation=instance_deviation)
+
+        key = make_key(
+            [instance.shape],
+            instance_deviation,
+            instance.quality,
+            instance_angular_tolerance,
+            compute_edges=render_edges,
+        )
+        # the key contains id(instance.shape), dedup._canonical keeps it stable
+        # across show calls
+        mesh = cache.get(key)
+        if mesh is not None:
+            instance.mesh = mesh
+            if progress is not None:
+                progress.update("c")
+            continue
+
+        keys[index] = key
+        jobs.append(
+            (
+                index,
+                serialize(instance.shape),
+                instance_deviation,
+                instance.quality,
+                instance_angular_tolerance,
+                render_edges,
+            )
+        )
+
+    if not jobs:
+        return 0
+
+    # at least 4 batches per worker to balance the load
+    total = sum(len(job[1]) for job in jobs)
+    batch_size = min(BATCH_SIZE, max(1, total // (4 * _pool_size())))
+
+    pool = get_pool()
+    try:
+        # imap keeps the order of the batches
+        for result in pool.imap(_tessellate_batch, _batches(jobs, batch_size)):
+            for index, mesh in result:
+                cad_objects.INSTANCES[index].mesh = mesh
+                cache[keys[index]] = mesh
+                if progress is not None:
+                    progress.update("+")
+    finally:
+        release_pool()
+
+    return len(jobs)
+
+
+atexit.register(shutdown_pool)
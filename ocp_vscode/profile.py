@@ -0,0 +1,128 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Structured timings of a show call, see show(..., profile=True)"""
+
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Profile:
+    """Timings and sizes of one show call
+
+    - stages:  Seconds spent per stage on the Python side, e.g. "to_assembly" or "http send"
+    - viewer:  Seconds spent per stage in VS Code, "receive", "forward", "decode" and "render"
+               (rendering includes uploading the meshes to the GPU)
+    - parts:   Mesh sizes per part, a list of dicts with "id", "vertices", "triangles", "segments"
+    - payload: Bytes sent to the viewer, after compression, see set_transport
+    - dedup:   Parts referencing an instance and instance meshes, see show(..., dedup=True)
+    - pool:    Instances tessellated in the worker pool, see show(..., parallel=True)
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.viewer = {}
+        self.parts = []
+        self.payload = 0
+        self.dedup = {"references": 0, "meshes": 0}
+        self.pool = 0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_viewer(self, timings):
+        # the viewer reports milliseconds
+        for stage, ms in timings.items():
+            self.viewer[stage] = self.viewer.get(stage, 0.0) + ms / 1000
+
+    def add_dedup(self, references, meshes):
+        self.dedup["references"] += references
+        self.dedup["meshes"] += meshes
+
+    def add_pool(self, jobs):
+        self.pool += jobs
+
+    @property
+    def dedup_ratio(self):
+        """Parts per tessellated instance mesh"""
+        return self.dedup["references"] / max(self.dedup["meshes"], 1)
+
+    def add_parts(self, instances, shapes):
+        def count(mesh, key, dim):
+            value = mesh.get(key)
+            if value is None:
+                return 0
+            if isinstance(value, np.ndarray):
+                return value.size // dim
+            return sum(np.size(el) for el in value) // dim
+
+        def walk(obj):
+            for part in obj.get("parts", []):
+                walk(part)
+            if obj.get("type") == "shapes":
+                mesh = obj["shape"]
+                if mesh.get("ref") is not None:
+                    mesh = instances[mesh["ref"]]
+                self.parts.append(
+                    {
+                        "id": obj["id"],
+                        "vertices": count(mesh, "vertices", 3),
+                        "triangles": count(mesh, "triangles", 3),
+                        "segments": count(mesh, "edges", 6),
+                    }
+                )
+
+        walk(shapes)
+
+    def to_dict(self):
+        return {
+            "stages": dict(self.stages),
+            "viewer": dict(self.viewer),
+            "parts": list(self.parts),
+            "payload": self.payload,
+            "dedup": dict(self.dedup),
+            "pool": self.pool,
+        }
+
+    def __repr__(self):
+        lines = ["Profile"]
+        for stage, seconds in self.stages.items():
+            lines.append("%8.3f sec: %s" % (seconds, stage))
+        for stage, seconds in self.viewer.items():
+            lines.append("%8.3f sec: viewer %s" % (seconds, stage))
+        lines.append(f"{len(self.parts)} parts, {self.payload} bytes sent")
+        if self.dedup["meshes"] > 0:
+            lines.append(
+                "%d instance references, %d meshes (dedup ratio %.1f)"
+                % (self.dedup["references"], self.dedup["meshes"], self.dedup_ratio)
+            )
+        if self.pool > 0:
+            lines.append(f"{self.pool} instances tessellated in the pool")
+        return "\n".join(lines)
+
+
+@contextmanager
+def timer(profile, timeit, name, activity, level=0):
+    """ocp_tessellate's Timer that additionally records the time in profile"""
+    from ocp_tessellate.utils import Timer
+
+    start = time.perf_counter()
+    with Timer(timeit, name, activity, level):
+        yield
+    if profile is not None:
+        profile.add(activity, time.perf_counter() - start)
@@ -0,0 +1,206 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Sessions for showing objects from several threads, see Session
+
+show, show_object and friends are thread safe: tessellation and sending are
+serialized by one lock in show.py, since ocp_tessellate keeps its state in
+module globals, and the objects the viewers hold are tracked per viewer. A
+Session additionally has its own object stack for show_object and coalesces
+updates: a background thread regenerating a model calls update as often as it
+likes, only the last objects of a burst get tessellated and sent.
+
+The module level show_object and reset_show use a default session.
+"""
+
+import threading
+from concurrent.futures import Future
+
+from .show import Progress, _update, show
+
+# seconds update waits for further updates before sending
+DEBOUNCE = 0.1
+
+_DEFAULT = None
+_default_lock = threading.Lock()
+
+
+class Session:
+    """Objects shown by one producer, e.g. a file watcher, a notebook or a thread
+    Parameters
+    - port:     The port the viewer listens to, a Viewer or a list of Viewers
+                (default=None, the port of set_port)
+    - debounce: Seconds update waits for further updates before sending (default=0.1)
+    """
+
+    def __init__(self, port=None, debounce=DEBOUNCE):
+        self.port = port
+        self.debounce = debounce
+
+        # guards the object stack and the pending update
+        self._lock = threading.RLock()
+        # one update at a time, in the order they were taken
+        self._sending = threading.Lock()
+
+        self._objects = {"objs": [], "names": [], "colors": [], "alphas": []}
+        self._pending = None
+        self._waiting = []
+        self._timer = None
+
+    def show(self, *cad_objs, **kwargs):
+        """Show CAD objects in the viewers of the session, see show"""
+        return show(*cad_objs, port=self.port, **kwargs)
+
+    def reset_show(self):
+        """Clear the object stack of show_object"""
+        with self._lock:
+            self._objects = {"objs": [], "names": [], "colors": [], "alphas": []}
+
+    def show_object(
+        self,
+        obj,
+        name=None,
+        options=None,
+        parent=None,
+        clear=False,
+        port=None,
+        progress="-+c",
+        binary=True,
+        quantize=False,
+        **kwargs,
+    ):
+        """Add an object to the object stack and show the stack, see show_object"""
+        from ocp_tessellate.defaults import get_default
+
+        with self._lock:
+            if clear:
+                self.reset_show()
+
+            if parent is not None:
+                self._objects["objs"].append(parent)
+                self._objects["names"].append("parent")
+                self._objects["colors"].append(get_default("default_color"))
+                self._objects["alphas"].append(0.25)
+
+            if options is None:
+                color = None
+                alpha = 1.0
+            else:
+                color = options.get("color")
+                alpha = options.get("alpha", 1.0)
+
+            self._objects["objs"].append(obj)
+            self._objects["names"].append(name)
+            self._objects["colors"].append(color)
+            self._objects["alphas"].append(alpha)
+
+            objects = {key: list(values) for key, values in self._objects.items()}
+
+        prefix = f"{name} " if name is not None else ""
+
+        print(f"\nshow_object {prefix}<{obj}>")
+        return _update(
+            *objects["objs"],
+            names=objects["names"],
+            colors=objects["colors"],
+            alphas=objects["alphas"],
+            port=self.port if port is None else port,
+            progress=Progress([] if progress is None else [c for c in progress]),
+            binary=binary,
+            quantize=quantize,
+            **kwargs,
+        )
+
+    def update(self, *cad_objs, names=None, colors=None, alphas=None, **kwargs):
+        """Show CAD objects after debounce seconds without blocking
+
+        Updates arriving in the meantime replace the pending one, the last one wins.
+        Like show_object only the objects the viewer does not hold yet get tessellated.
+        Keywords are the ones of show. Returns a concurrent.futures.Future, done when
+        these or later objects are shown.
+        """
+        n = len(cad_objs)
+        for attr, values in (("names", names), ("colors", colors), ("alphas", alphas)):
+            if values is not None and len(values) != n:
+                raise ValueError(f"Length of cad_objs and {attr} need to be the same")
+
+        future = Future()
+        with self._lock:
+            self._pending = dict(
+                cad_objs=cad_objs,
+                names=[None] * n if names is None else names,
+                colors=[None] * n if colors is None else colors,
+                alphas=[None] * n if alphas is None else alphas,
+                kwargs=kwargs,
+            )
+            self._waiting.append(future)
+
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+        return future
+
+    def flush(self):
+        """Send a pending update right away and wait for it"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self._flush()
+
+    def _flush(self):
+        with self._sending:
+            # a later update could have come in while the previous one was sent
+            with self._lock:
+                pending, waiting = self._pending, self._waiting
+                self._pending, self._waiting = None, []
+            if pending is None:
+                return
+
+            kwargs = dict(pending["kwargs"])
+            progress = kwargs.pop("progress", "-+c")
+            try:
+                result = _update(
+                    *pending["cad_objs"],
+                    names=pending["names"],
+                    colors=pending["colors"],
+                    alphas=pending["alphas"],
+                    port=kwargs.pop("port", self.port),
+                    progress=Progress(
+                        [] if progress is None else [c for c in progress]
+                    ),
+                    **kwargs,
+                )
+            except Exception as ex:
+                for future in waiting:
+                    future.set_exception(ex)
+                return
+
+            for future in waiting:
+                future.set_result(result)
+
+
+def default_session():
+    """The session of the module level show_object and reset_show"""
+    global _DEFAULT
+
+    with _default_lock:
+        if _DEFAULT is None:
+            _DEFAULT = Session()
+        return _DEFAULT
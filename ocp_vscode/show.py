@@ -14,27 +14,68 @@
 # limitations under the License.
 #
 
-import requests
+import functools
+import mmap
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from urllib.parse import quote
+
+import numpy as np
 import orjson as json
 
-from ocp_tessellate import PartGroup
-from ocp_tessellate.convert import (
-    tessellate_group,
-    get_normal_len,
-    combined_bb,
-    to_assembly,
-    mp_get_results,
-)
-from ocp_tessellate.defaults import get_default, get_defaults, preset
-from ocp_tessellate.utils import numpy_to_buffer_json, Timer, Color
-from ocp_tessellate.mp_tessellator import init_pool, keymap, close_pool
-from ocp_tessellate.cad_objects import OCP_PartGroup
+from . import comms
+from .binary import MAGIC, has_instances, hash_meshes, mesh_hashes, to_binary
+from .profile import Profile, timer
 
+# ocp_tessellate, OCP and the modules using them are imported in the functions
+# on first use, importing OCP takes more than a second, see
+# benchmarks/bench_import.py
 
 CMD_PORT = 3939
 REQUEST_TIMEOUT = 2000
 
-OBJECTS = {"objs": [], "names": [], "colors": [], "alphas": []}
+# stages of the viewer a message goes through, see controller.ts
+VIEWER_STAGES = ("receive", "forward", "decode", "render")
+
+# seconds between two messages when streaming objects to the viewer
+STREAM_INTERVAL = 0.5
+
+# background thread for show_async and the refinement of show(..., lod=True)
+EXECUTOR = None
+
+# Top level objects the viewers currently hold per target, see _update
+VIEWER_OBJECTS = {}
+
+# Epoch of every panel (port, session) as reported by the command server, it
+# changes when the panel lost its objects, e.g. since VS Code was restarted
+EPOCHS = {}
+
+# _send result of an update the viewer rejected, since its epoch changed
+_STALE = object()
+
+# ocp_tessellate keeps the instances, keymap and caches of a tessellation in
+# module globals, so tessellating and showing from several threads is serialized
+_LOCK = threading.RLock()
+
+BB_KEYS = ("xmin", "xmax", "ymin", "ymax", "zmin", "zmax")
+
+# Parameters that change the tessellation result of an object
+TESSELLATION_KEYS = (
+    "deviation",
+    "angular_tolerance",
+    "edge_accuracy",
+    "render_edges",
+    "render_mates",
+    "mate_scale",
+    "default_color",
+    "show_parent",
+    "adaptive",
+    "triangle_budget",
+    "dedup",
+)
 
 
 class Progress:
@@ -54,49 +95,183 @@ def set_port(port):
     CMD_PORT = port
 
 
-def _send(data, port=None, timeit=False):
-    if port is None:
-        port = CMD_PORT
+def _scene(data):
+    # the command server keeps the messages of the last scene to restore the
+    # viewer when its panel gets re-created: "new" starts a scene, "add" extends it
+    if data["type"] == "data" or (data["type"] == "update" and data["clear"]):
+        return "new"
+    return "add"
+
+
+def _targets(port):
+    """Map ports to the sessions a message goes to
+
+    port is a port, None for the port of set_port, a Viewer or a list of Viewers.
+    Viewers on the same port share one request, the command server forwards it
+    to the panels of all their sessions.
+    """
+    targets = {}
+    for viewer in port if isinstance(port, (list, tuple)) else [port]:
+        if hasattr(viewer, "session"):
+            port, session = viewer.port, viewer.session
+        else:
+            port, session = viewer, None
+        sessions = targets.setdefault(CMD_PORT if port is None else port, [])
+        if session not in sessions:
+            sessions.append(session)
+    return targets
+
+
+def _with_sessions(headers, sessions):
+    if sessions == [None]:
+        return headers
+    # percent encoded, header values are latin-1 only
+    return {
+        **headers,
+        "X-OCP-Session": ",".join(
+            quote(session or "", safe="") for session in sessions
+        ),
+    }
+
+
+def _with_epochs(headers, port, sessions):
+    epochs = [EPOCHS.get((port, session), "") for session in sessions]
+    if not any(epochs):
+        return headers
+    return {**headers, "X-OCP-Epoch": ",".join(epochs)}
+
+
+def _record_epochs(r, port, sessions):
+    epochs = r.headers.get("X-OCP-Epoch")
+    if epochs is not None:
+        for session, epoch in zip(sessions, epochs.split(",")):
+            EPOCHS[(port, session)] = epoch.strip()
+
+
+def _target_key(port):
+    return tuple((port, tuple(sessions)) for port, sessions in _targets(port).items())
+
+
+def _forget(port):
+    """The viewers of port get a new scene, drop what they held"""
+    panels = {(p, s) for p, sessions in _target_key(port) for s in sessions}
+    for key in list(VIEWER_OBJECTS):
+        if any((p, s) in panels for p, sessions in key for s in sessions):
+            del VIEWER_OBJECTS[key]
+
+
+def _locked(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _LOCK:
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _send(
+    data,
+    port=None,
+    timeit=False,
+    binary=False,
+    quantize=False,
+    profile=None,
+    epoch=False,
+):
+    """Send a message to the viewers of port
+
+    With epoch=True the message only applies to the objects the panels held
+    when their epochs were recorded: a panel with another epoch rejects it and
+    _STALE is returned.
+    """
+    targets = _targets(port)
+    timeout = REQUEST_TIMEOUT / 1000
+
+    headers = {"X-OCP-Scene": _scene(data)}
+    # the viewer answers with the duration of its stages in ms when asked for
+    if timeit or profile is not None:
+        headers["X-OCP-Timings"] = "1"
+
+    def encode(known):
+        if binary:
+            with timer(profile, timeit, "", "binary encode", 1):
+                return to_binary(data, quantize=quantize, known=known)
+        with timer(profile, timeit, "", "json dumps", 1):
+            return [json.dumps(data)]
+
+    responses = []
     try:
-        with Timer(timeit, "", "json dumps", 1):
-            j = json.dumps(data)
+        known = set()
+        if binary:
+            # meshes all command servers have cached are only sent as hash
+            if has_instances(data) and all(
+                "hashes" in comms.features(p, timeout) for p in targets
+            ):
+                with timer(profile, timeit, "", "hash meshes", 1):
+                    data = hash_meshes(data, quantize=quantize)
+                with timer(profile, timeit, "", "query mesh cache", 1):
+                    hashes = mesh_hashes(data)
+                    known = set.intersection(
+                        *(comms.known_hashes(hashes, p, timeout) for p in targets)
+                    )
+            content_type = "application/octet-stream"
+        else:
+            content_type = "application/json"
 
-        with Timer(timeit, "", "http send", 1):
-            r = requests.post(f"http://127.0.0.1:{port}", data=j)
+        # the message is encoded once for all viewers
+        chunks = encode(known)
+        for target, sessions in targets.items():
+            target_headers = _with_sessions(headers, sessions)
+            if epoch:
+                target_headers = _with_epochs(target_headers, target, sessions)
+            with timer(profile, timeit, "", "http send", 1):
+                r = comms.send(chunks, content_type, target, timeout, target_headers)
+            if profile is not None:
+                profile.payload += comms.sent_bytes()
+
+            # meshes evicted from the cache in the meantime get sent again
+            if r.status_code == 409 and known:
+                missing = set(json.loads(r.text).get("missing", []))
+                sent = encode(known - missing)
+                with timer(profile, timeit, "", "http send", 1):
+                    r = comms.send(sent, content_type, target, timeout, target_headers)
+                if profile is not None:
+                    profile.payload += comms.sent_bytes()
+
+            _record_epochs(r, target, sessions)
+            responses.append(r)
 
     except Exception as ex:
         print("Cannot connect to viewer, is it running and the right port provided?")
         return
 
-    if r.status_code != 201:
-        print("Error", r.text)
+    result = None
+    for r in responses:
+        if r.status_code == 412:
+            result = _STALE
+            continue
 
+        if r.status_code != 201:
+            print("Error", r.text)
+            continue
 
-def _tessellate(
-    *cad_objs, names=None, colors=None, alphas=None, progress=None, **kwargs
-):
-    timeit = preset("timeit", kwargs.get("timeit"))
-
-    if progress is None:
-        progress = Progress([c for c in "-+c"])
+        if r.headers.get("Content-Type") == "application/json":
+            timings = json.loads(r.text)
+            if profile is not None:
+                profile.add_viewer(timings)
+            if timeit:
+                for stage in VIEWER_STAGES:
+                    if stage in timings:
+                        print(
+                            "%8.3f sec: | | viewer %s" % (timings[stage] / 1000, stage)
+                        )
+            if result is None:
+                result = timings
+    return result
 
-    with Timer(timeit, "", "to_assembly", 1):
-        part_group = to_assembly(
-            *cad_objs,
-            names=names,
-            colors=colors,
-            alphas=alphas,
-            render_mates=kwargs.get("render_mates", get_default("render_mates")),
-            mate_scale=kwargs.get("mate_scale", get_default("mate_scale")),
-            default_color=kwargs.get("default_color", get_default("default_color")),
-            show_parent=kwargs.get("show_parent", get_default("show_parent")),
-            progress=progress,
-        )
 
-        if len(part_group.objects) == 1 and isinstance(
-            part_group.objects[0], PartGroup
-        ):
-            part_group = part_group.objects[0]
+def _get_config(kwargs):
+    from ocp_tessellate.defaults import get_defaults
 
     # Do not send defaults for postion, rotation and zoom unless they are set in kwargs
     config = {
@@ -118,7 +293,13 @@ def _tessellate(
             "tools",
         )
     }
+    config.update(_config_changes(kwargs))
+
+    return config
+
 
+def _config_changes(kwargs):
+    config = {}
     for k, v in kwargs.items():
         if k in ["cad_width", "height"]:
             print(
@@ -137,42 +318,203 @@ def _tessellate(
         elif v is not None:
             config[k] = v
 
+    return config
+
+
+def _bounds(shapes):
+    """Bounding box of all parts and their largest accuracy
+
+    One walk collecting the bounding boxes of the parts into an array instead of
+    updating a BoundingBox part by part. The local bounding boxes of the parts
+    get removed like in ocp_tessellate's combined_bb.
+    """
+    from ocp_tessellate.ocp_utils import BoundingBox
+
+    bbs, accuracies = [], []
+    bb_values = itemgetter(*BB_KEYS)
+
+    def walk(obj):
+        for part in obj["parts"]:
+            if part.get("parts") is None:
+                bb = part.pop("bb", None)
+                if bb:
+                    bbs.append(bb_values(bb))
+                if part.get("type") == "shapes":
+                    accuracies.append(part["accuracy"])
+            else:
+                walk(part)
+
+    walk(shapes)
+
+    if bbs:
+        bbs = np.array(bbs, dtype=np.float64)
+        low = bbs[:, 0::2].min(axis=0)
+        high = bbs[:, 1::2].max(axis=0)
+        bb = {
+            "xmin": float(low[0]),
+            "xmax": float(high[0]),
+            "ymin": float(low[1]),
+            "ymax": float(high[1]),
+            "zmin": float(low[2]),
+            "zmax": float(high[2]),
+        }
+    else:
+        bb = BoundingBox().to_dict()
+
+    return bb, max(accuracies) if accuracies else None
+
+
+@_locked
+def _tessellate(
+    *cad_objs,
+    names=None,
+    colors=None,
+    alphas=None,
+    progress=None,
+    profile=None,
+    coarse=None,
+    **kwargs,
+):
+    # coarse: (deviation, angular_tolerance) for the instances only, see lod.py.
+    # Edges and vertices keep the requested tolerances, they never get refined
+    from ocp_tessellate import PartGroup
+    from ocp_tessellate.convert import tessellate_group, to_assembly
+    from ocp_tessellate.defaults import get_default, preset
+
+    from . import disk_cache
+    from .adaptive import scene_size, tessellate_adaptive
+    from .dedup import dedup_instances, instance_parts
+    from .lod import tessellate_coarse
+    from .parallel import tessellate_instances
+
+    timeit = preset("timeit", kwargs.get("timeit"))
+
+    if progress is None:
+        progress = Progress([c for c in "-+c"])
+
+    with timer(profile, timeit, "", "to_assembly", 1):
+        part_group = to_assembly(
+            *cad_objs,
+            names=names,
+            colors=colors,
+            alphas=alphas,
+            render_mates=kwargs.get("render_mates", get_default("render_mates")),
+            mate_scale=kwargs.get("mate_scale", get_default("mate_scale")),
+            default_color=kwargs.get("default_color", get_default("default_color")),
+            show_parent=kwargs.get("show_parent", get_default("show_parent")),
+            progress=progress,
+        )
+
+        if len(part_group.objects) == 1 and isinstance(
+            part_group.objects[0], PartGroup
+        ):
+            part_group = part_group.objects[0]
+
+    config = _get_config(kwargs)
+
+    if config.get("dedup", True):
+        with timer(profile, timeit, "", "dedup", 1):
+            references, meshes = dedup_instances(part_group)
+        if timeit:
+            print(f"{references} instance references share {meshes} meshes")
+        if profile is not None:
+            profile.add_dedup(references, meshes)
+
+    # plain solids and faces become instances as well, so that their meshes get
+    # cached, tessellated in the pool, adapted and refined like the ones of assemblies
+    instance_parts(part_group)
+
+    adaptive = config.get("adaptive", False)
+    if coarse is None:
+        deviation = preset("deviation", config.get("deviation"))
+        angular_tolerance = preset("angular_tolerance", config.get("angular_tolerance"))
+    else:
+        deviation, angular_tolerance = coarse
+    render_edges = preset("render_edges", config.get("render_edges"))
+
+    if disk_cache.DISK_CACHE is not None:
+        params = [
+            deviation,
+            angular_tolerance,
+            preset("edge_accuracy", config.get("edge_accuracy")),
+            render_edges,
+        ]
+        if adaptive:
+            # adapted tolerances depend on the size of the scene and the budget
+            params.append((scene_size(part_group), config.get("triangle_budget")))
+
+        with timer(profile, timeit, "", "load from disk cache", 1):
+            cache_keys = disk_cache.load_instances(params, progress)
+
     parallel = preset("parallel", config.get("parallel"))
-    if parallel and not any(
-        [isinstance(obj, OCP_PartGroup) for obj in part_group.objects]
-    ):
-        print("parallel only works for assemblies, setting it to False")
-        parallel = False
-        kwargs["parallel"] = False
 
-    with Timer(timeit, "", "tessellate", 1):
-        if parallel:
-            init_pool()
-            keymap.reset()
+    if adaptive:
+        with timer(profile, timeit, "", "adaptive tessellation", 1):
+            tessellate_adaptive(
+                part_group,
+                deviation,
+                angular_tolerance,
+                render_edges,
+                triangle_budget=config.get("triangle_budget"),
+                parallel=parallel,
+                progress=progress,
+                profile=profile,
+            )
+    if parallel:
+        # all parts with faces are instances now, tessellate them in the pool
+        # upfront, the remaining edges and vertices get tessellated serially
+        with timer(profile, timeit, "", "tessellate instances", 1):
+            jobs = tessellate_instances(
+                deviation, angular_tolerance, render_edges, progress
+            )
+        if profile is not None:
+            profile.add_pool(jobs)
+        kwargs["parallel"] = False
+    elif coarse is not None:
+        with timer(profile, timeit, "", "tessellate instances", 1):
+            tessellate_coarse(deviation, angular_tolerance, render_edges, progress)
 
+    with timer(profile, timeit, "", "tessellate", 1):
         instances, shapes, states = tessellate_group(
             part_group, kwargs, progress, config.get("timeit")
         )
 
-        if parallel:
-            instances, shapes = mp_get_results(instances, shapes, progress)
-            close_pool()
+    if disk_cache.DISK_CACHE is not None:
+        with timer(profile, timeit, "", "store to disk cache", 1):
+            disk_cache.store_instances(cache_keys, instances)
 
-    config["normal_len"] = get_normal_len(
-        preset("render_normals", config.get("render_normals")),
-        shapes,
-        preset("deviation", config.get("deviation")),
-    )
+    with timer(profile, timeit, "", "bb", 1):
+        bb, accuracy = _bounds(shapes)
 
-    with Timer(timeit, "", "bb", 1):
-        bb = combined_bb(shapes).to_dict()
+    if preset("render_normals", config.get("render_normals")) and accuracy is not None:
+        config["normal_len"] = (
+            accuracy / preset("deviation", config.get("deviation")) * 4
+        )
+    else:
+        config["normal_len"] = 0
 
     # add global bounding box
     shapes["bb"] = bb
+
+    if profile is not None:
+        profile.add_parts(instances, shapes)
+
     return instances, shapes, states, config, part_group.count_shapes()
 
 
-def _convert(*cad_objs, names=None, colors=None, alphas=None, progress=None, **kwargs):
+def _convert(
+    *cad_objs,
+    names=None,
+    colors=None,
+    alphas=None,
+    progress=None,
+    binary=False,
+    profile=None,
+    **kwargs,
+):
+    from ocp_tessellate.defaults import preset
+    from ocp_tessellate.utils import numpy_to_buffer_json
+
     timeit = preset("timeit", kwargs.get("timeit"))
 
     if progress is None:
@@ -184,13 +526,14 @@ def _convert(*cad_objs, names=None, colors=None, alphas=None, progress=None, **k
         colors=colors,
         alphas=alphas,
         progress=progress,
+        profile=profile,
         **kwargs,
     )
-    with Timer(timeit, "", "create data obj", 1):
+    with timer(profile, timeit, "", "create data obj", 1):
+        mesh_data = dict(instances=instances, shapes=shapes, states=states)
         data = {
-            "data": numpy_to_buffer_json(
-                dict(instances=instances, shapes=shapes, states=states)
-            ),
+            # the binary wire format keeps the numpy arrays for _send
+            "data": mesh_data if binary else numpy_to_buffer_json(mesh_data),
             "type": "data",
             "config": config,
             "count": count_shapes,
@@ -198,8 +541,334 @@ def _convert(*cad_objs, names=None, colors=None, alphas=None, progress=None, **k
     return data
 
 
+def _object_key(name, color, alpha, kwargs):
+    from ocp_tessellate.defaults import preset
+
+    return (
+        name,
+        repr(color),
+        alpha,
+        tuple(repr(preset(k, kwargs.get(k))) for k in TESSELLATION_KEYS),
+    )
+
+
+def _top_level_parts(shapes, states, taken, offset):
+    """Split a tessellated object into top level parts with ids unique in the viewer
+
+    Instance references get shifted by offset, since the instances of all added
+    objects are sent as one list.
+    """
+    parts = shapes["parts"] if shapes["id"] == "/Group" else [shapes]
+    mapping = {}
+
+    def walk(part, old, new):
+        part_id = part["id"]
+        part["id"] = new + part_id[len(old) :]
+        mapping[part_id] = part["id"]
+
+        if part.get("parts") is None:
+            shape = part["shape"]
+            if isinstance(shape, dict) and shape.get("ref") is not None:
+                part["shape"] = {"ref": shape["ref"] + offset}
+        else:
+            for child in part["parts"]:
+                walk(child, old, new)
+
+    for part in parts:
+        name = part["name"]
+        i = 2
+        while f"/Group/{name}" in taken:
+            name = f"{part['name']}({i})"
+            i += 1
+        part["name"] = name
+        walk(part, part["id"], f"/Group/{name}")
+        taken.add(part["id"])
+
+    return parts, {mapping.get(k, k): v for k, v in states.items()}
+
+
+@_locked
+def _update(
+    *cad_objs,
+    names=None,
+    colors=None,
+    alphas=None,
+    port=None,
+    progress=None,
+    binary=True,
+    quantize=False,
+    stream=False,
+    keep_all=False,
+    profile=None,
+    **kwargs,
+):
+    """Send only the objects the viewer does not hold yet.
+
+    Objects are compared in order with the objects the viewers of port hold,
+    see VIEWER_OBJECTS: the unchanged leading objects stay in the viewer, all
+    following objects get removed and the new ones get tessellated and added.
+    With keep_all=True all unchanged objects stay, wherever they are, and only
+    the changed ones get removed and added at the end.
+    With stream=True the added objects are sent while they get tessellated
+    instead of in one message at the end. When a panel lost its objects in the
+    meantime, e.g. since VS Code was restarted, all objects are sent again.
+    Returns profile if given, else the result of the last _send.
+    """
+    from ocp_tessellate.defaults import preset
+    from ocp_tessellate.ocp_utils import BoundingBox
+    from ocp_tessellate.utils import Color, numpy_to_buffer_json
+
+    from .lod import cancel_refinement
+
+    cancel_refinement()
+    timeit = preset("timeit", kwargs.get("timeit"))
+
+    if kwargs.get("default_edgecolor") is not None:
+        kwargs["default_edgecolor"] = Color(kwargs["default_edgecolor"]).web_color
+
+    if progress is None:
+        progress = Progress([c for c in "-+c"])
+
+    keys = [
+        _object_key(name, color, alpha, kwargs)
+        for name, color, alpha in zip(names, colors, alphas)
+    ]
+
+    # viewers shared with other targets hold other objects, they start from scratch
+    target = _target_key(port)
+    viewer_objects = VIEWER_OBJECTS.get(target, [])
+    _forget(port)
+    VIEWER_OBJECTS[target] = viewer_objects
+
+    added = list(zip(cad_objs, names, colors, alphas, keys))
+    if keep_all:
+        held, kept_objects, added = list(viewer_objects), [], []
+        for cad_obj, name, color, alpha, key in zip(
+            cad_objs, names, colors, alphas, keys
+        ):
+            index = next(
+                (
+                    i
+                    for i, (obj, k, _, _) in enumerate(held)
+                    if obj is cad_obj and k == key
+                ),
+                None,
+            )
+            if index is None:
+                added.append((cad_obj, name, color, alpha, key))
+            else:
+                kept_objects.append(held.pop(index))
+        removed = held
+        viewer_objects[:] = kept_objects
+    else:
+        kept = 0
+        for (obj, key, _, _), cad_obj, new_key in zip(viewer_objects, cad_objs, keys):
+            if obj is not cad_obj or key != new_key:
+                break
+            kept += 1
+        removed = viewer_objects[kept:]
+        del viewer_objects[kept:]
+        added = added[kept:]
+
+    kept = len(viewer_objects)
+    remove = [part_id for _, _, ids, _ in removed for part_id in ids]
+    taken = {part_id for _, _, ids, _ in viewer_objects for part_id in ids}
+
+    def message(instances, parts, states, count, config, first):
+        bb = None
+        for _, _, _, obj_bb in viewer_objects:
+            if bb is None:
+                bb = BoundingBox(obj_bb)
+            else:
+                bb.update(obj_bb)
+
+        mesh_data = dict(
+            instances=instances,
+            shapes={
+                "parts": parts,
+                "bb": (BoundingBox() if bb is None else bb).to_dict(),
+            },
+            states=states,
+        )
+        return {
+            "data": mesh_data if binary else numpy_to_buffer_json(mesh_data),
+            "type": "update",
+            "remove": remove if first else [],
+            "clear": kept == 0 and first,
+            "config": config,
+            "count": count,
+        }
+
+    instances, parts, states, count = [], [], {}, 0
+    config = None
+    first = True
+    last_send = None
+    result = None
+    with timer(profile, timeit, "", "overall"):
+        for cad_obj, name, color, alpha, key in added:
+            obj_instances, shapes, obj_states, config, obj_count = _tessellate(
+                cad_obj,
+                names=[name],
+                colors=[color],
+                alphas=[alpha],
+                progress=progress,
+                profile=profile,
+                **kwargs,
+            )
+            obj_parts, obj_states = _top_level_parts(
+                shapes, obj_states, taken, len(instances)
+            )
+            viewer_objects.append(
+                (cad_obj, key, [part["id"] for part in obj_parts], shapes["bb"])
+            )
+            instances += obj_instances
+            parts += obj_parts
+            states.update(obj_states)
+            count += obj_count
+
+            # stream the first object immediately, then at most every STREAM_INTERVAL
+            if stream and (
+                last_send is None or time.time() - last_send > STREAM_INTERVAL
+            ):
+                data = message(instances, parts, states, count, config, first)
+                with timer(profile, timeit, "", "send"):
+                    result = _send(
+                        data,
+                        port=port,
+                        timeit=timeit,
+                        binary=binary,
+                        quantize=quantize,
+                        profile=profile,
+                        epoch=not data["clear"],
+                    )
+                if result is _STALE:
+                    break
+                instances, parts, states, count = [], [], {}, 0
+                first = False
+                last_send = time.time()
+
+        if config is None:
+            config = _get_config(kwargs)
+
+        if result is not _STALE and (first or parts):
+            data = message(instances, parts, states, count, config, first)
+            with timer(profile, timeit, "", "send"):
+                result = _send(
+                    data,
+                    port=port,
+                    timeit=timeit,
+                    binary=binary,
+                    quantize=quantize,
+                    profile=profile,
+                    epoch=not data["clear"],
+                )
+
+    if result is _STALE:
+        # the viewer lost the objects, e.g. it was restarted, send all of them again
+        _forget(port)
+        return _update(
+            *cad_objs,
+            names=names,
+            colors=colors,
+            alphas=alphas,
+            port=port,
+            progress=progress,
+            binary=binary,
+            quantize=quantize,
+            stream=stream,
+            keep_all=keep_all,
+            profile=profile,
+            **kwargs,
+        )
+
+    return result if profile is None else profile
+
+
+def _executor():
+    global EXECUTOR
+
+    if EXECUTOR is None:
+        EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocp_vscode")
+    return EXECUTOR
+
+
+def _log_exception(future):
+    if future.exception() is not None:
+        print("show failed:", future.exception())
+
+
+def show_async(
+    *cad_objs,
+    names=None,
+    colors=None,
+    alphas=None,
+    port=None,
+    progress="-+c",
+    binary=True,
+    quantize=False,
+    profile=False,
+    **kwargs,
+):
+    """Show CAD objects in Visual Studio Code without blocking
+
+    Tessellation runs in a background thread and the objects are streamed to
+    the viewer while they get tessellated. Parameters are the same as for show.
+    Returns a concurrent.futures.Future which is done when all objects are sent,
+    with profile=True its result is the Profile.
+    """
+    from .lod import cancel_refinement
+
+    if kwargs.pop("lod", False):
+        # streamed objects are sent as they get tessellated, there is no coarse pass
+        raise ValueError("lod=True is not supported for non-blocking show")
+
+    if names is not None and len(names) != len(set(names)):
+        raise ValueError("All names need to be unique")
+
+    n = len(cad_objs)
+    for attr, values in (("names", names), ("colors", colors), ("alphas", alphas)):
+        if values is not None and len(values) != n:
+            raise ValueError(f"Length of cad_objs and {attr} need to be the same")
+
+    progress = Progress([] if progress is None else [c for c in progress])
+
+    # the viewer will hold a new scene, so show_object needs to start from scratch
+    with _LOCK:
+        _forget(port)
+        cancel_refinement()
+
+    future = _executor().submit(
+        _update,
+        *cad_objs,
+        names=[None] * n if names is None else names,
+        colors=[None] * n if colors is None else colors,
+        alphas=[None] * n if alphas is None else alphas,
+        port=port,
+        progress=progress,
+        binary=binary,
+        quantize=quantize,
+        stream=True,
+        profile=Profile() if profile else None,
+        **kwargs,
+    )
+    future.add_done_callback(_log_exception)
+    return future
+
+
+@_locked
 def show(
-    *cad_objs, names=None, colors=None, alphas=None, port=None, progress="-+c", **kwargs
+    *cad_objs,
+    names=None,
+    colors=None,
+    alphas=None,
+    port=None,
+    progress="-+c",
+    binary=True,
+    quantize=False,
+    block=True,
+    profile=False,
+    lod=False,
+    **kwargs,
 ):
     """Show CAD objects in Visual Studio Code
     Parameters
@@ -209,9 +878,20 @@ def show(
     - names:             List of names for the cad_objs. Needs to have the same length as cad_objs
     - colors:            List of colors for the cad_objs. Needs to have the same length as cad_objs
     - alphas:            List of alpha values for the cad_objs. Needs to have the same length as cad_objs
-    - port:              The port the viewer listens to. Typically use 'set_port(port)' instead
+    - port:              The port the viewer listens to. Typically use 'set_port(port)' instead.
+                         A Viewer or a list of Viewers sends to their panels, see viewer.py
     - progress:          Show progress of tessellation with None is no progress indicator. (default="-+c")
                          for object: "-": is reference, "+": gets tessellated, "c": from cache
+    - binary:            Send the meshes as binary buffers instead of hex encoded JSON (default=True)
+    - quantize:          With binary, send vertices as 16 bit integers, normals octahedral encoded and
+                         triangles as 16 bit indices where possible, about half the size (default=False)
+    - block:             Wait until all objects are sent. With False, tessellate in the background, stream
+                         the objects to the viewer and return a Future instead (default=True)
+    - profile:           Return a Profile with the timings of all stages in Python and in the viewer
+                         and the mesh sizes of all parts (default=False)
+    - lod:               Send coarse meshes first and refine solids and faces in the background with the
+                         requested deviation and angular_tolerance, largest first. Needs block=True
+                         (default=False)
 
     Valid keywords to configure the viewer (**kwargs):
     - axes:              Show axes (default=False)
@@ -232,11 +912,37 @@ def show(
     - deviation:         Shapes: Deviation from linear deflection value (default=0.1)
     - angular_tolerance: Shapes: Angular deflection in radians for tessellation (default=0.2)
     - edge_accuracy:     Edges: Precision of edge discretization (default: mesh quality / 100)
+    - adaptive:          Shapes: Coarser tolerances for parts that are small compared to the scene (default=False)
+    - triangle_budget:   Shapes: With adaptive, scale tolerances until the scene has at most this
+                         many triangles (default=None)
+    - dedup:             Shapes: Tessellate solids with identical geometry once and send them as
+                         references with their location (default=True)
     - ambient_intensity  Intensity of ambient ligth (default=1.0)
     - direct_intensity   Intensity of direct lights (default=0.12)
     """
 
+    from ocp_tessellate.defaults import preset
+    from ocp_tessellate.utils import Color, numpy_to_buffer_json
+
+    from .lod import cancel_refinement, coarse_tolerances, refine, refinement_jobs
+
+    if not block:
+        return show_async(
+            *cad_objs,
+            names=names,
+            colors=colors,
+            alphas=alphas,
+            port=port,
+            progress=progress,
+            binary=binary,
+            quantize=quantize,
+            profile=profile,
+            lod=lod,
+            **kwargs,
+        )
+
     timeit = preset("timeit", kwargs.get("timeit"))
+    profile = Profile() if profile else None
 
     if names is not None:
         if len(names) != len(set(names)):
@@ -253,24 +959,199 @@ def show(
 
     progress = Progress([] if progress is None else [c for c in progress])
 
-    with Timer(timeit, "", "overall"):
+    # the viewer will hold a new scene, so show_object needs to start from scratch
+    _forget(port)
+    generation = cancel_refinement()
+
+    coarse = None
+    if lod:
+        deviation = preset("deviation", kwargs.get("deviation"))
+        angular_tolerance = preset("angular_tolerance", kwargs.get("angular_tolerance"))
+        coarse = coarse_tolerances(deviation, angular_tolerance)
+
+    with timer(profile, timeit, "", "overall"):
         data = _convert(
             *cad_objs,
             names=names,
             colors=colors,
             alphas=alphas,
             progress=progress,
+            binary=binary,
+            profile=profile,
+            coarse=coarse,
             **kwargs,
         )
+        if lod:
+            jobs = refinement_jobs(data["data"]["shapes"])
 
-    with Timer(timeit, "", "send"):
-        return _send(data, port=port, timeit=timeit)
+    with timer(profile, timeit, "", "send"):
+        result = _send(
+            data,
+            port=port,
+            timeit=timeit,
+            binary=binary,
+            quantize=quantize,
+            profile=profile,
+        )
+
+    if lod and jobs:
+
+        def send(meshes, ids):
+            refined = dict(instances=meshes, ids=ids)
+            _send(
+                {
+                    "data": refined if binary else numpy_to_buffer_json(refined),
+                    "type": "refine",
+                },
+                port=port,
+                binary=binary,
+                quantize=quantize,
+            )
+
+        future = _executor().submit(
+            refine,
+            jobs,
+            generation,
+            deviation,
+            angular_tolerance,
+            preset("render_edges", kwargs.get("render_edges")),
+            send,
+            STREAM_INTERVAL,
+        )
+        future.add_done_callback(_log_exception)
+
+    return result if profile is None else profile
+
+
+def show_config(port=None, **kwargs):
+    """Change viewer settings of the shown objects without tessellating them again
+
+    Only the settings are sent, the viewer renders the meshes it holds with them,
+    e.g. show_config(axes=True, grid=[True, False, False]). The camera is kept
+    unless reset_camera=True or zoom, position, quaternion or target are given.
+
+    Parameters
+    - port:              The port the viewer listens to. Typically use 'set_port(port)' instead.
+                         A Viewer or a list of Viewers sends to their panels, see viewer.py
+
+    Valid keywords to configure the viewer (**kwargs):
+    - axes, axes0, grid, ticks, ortho, up, transparent, black_edges, default_edgecolor,
+      default_opacity, ambient_intensity, direct_intensity, reset_camera, zoom, position,
+      quaternion, target: see show
+    - render_edges:      Show or hide the edges of all shapes, edges are only available
+                         when they were tessellated, i.e. shown with render_edges=True
+    Settings that change the tessellation (e.g. deviation or render_normals) need show.
+    """
+    from ocp_tessellate.utils import Color
+
+    config = {}
+    for k, v in _config_changes(kwargs).items():
+        if k in TESSELLATION_KEYS + ("render_normals",) and k != "render_edges":
+            print(f"Setting {k} changes the tessellation, use show instead")
+        elif k == "default_edgecolor":
+            config[k] = Color(v).web_color
+        else:
+            config[k] = v
+
+    return _send({"type": "config", "config": config}, port=port)
+
+
+def save_scene(
+    *cad_objs,
+    path,
+    names=None,
+    colors=None,
+    alphas=None,
+    progress="-+c",
+    quantize=False,
+    **kwargs,
+):
+    """Tessellate CAD objects and save the binary message show would send to a file
+    Parameters
+    - cad_objs:          All cad objects that should be saved as positional parameters
+
+    Keywords for save_scene:
+    - path:              The path of the scene file, by convention with extension .ocpb
+    - names:             List of names for the cad_objs. Needs to have the same length as cad_objs
+    - colors:            List of colors for the cad_objs. Needs to have the same length as cad_objs
+    - alphas:            List of alpha values for the cad_objs. Needs to have the same length as cad_objs
+    - progress:          Show progress of tessellation with None is no progress indicator. (default="-+c")
+                         for object: "-": is reference, "+": gets tessellated, "c": from cache
+    - quantize:          Save vertices as 16 bit integers, normals octahedral encoded and
+                         indices as 16 bit where possible (default=False)
+
+    Valid keywords (**kwargs) are the keywords of show, the viewer settings are saved
+    with the meshes. The file is the binary wire format with 8 byte aligned buffers,
+    load_scene or the command "OCP CAD Viewer: Open scene file" show it without
+    tessellating again.
+    """
+    from ocp_tessellate.utils import Color
+
+    if kwargs.get("default_edgecolor") is not None:
+        kwargs["default_edgecolor"] = Color(kwargs["default_edgecolor"]).web_color
+
+    data = _convert(
+        *cad_objs,
+        names=names,
+        colors=colors,
+        alphas=alphas,
+        progress=Progress([] if progress is None else [c for c in progress]),
+        binary=True,
+        **kwargs,
+    )
+    with open(path, "wb") as f:
+        for chunk in to_binary(data, quantize=quantize):
+            f.write(chunk)
+
+
+@_locked
+def load_scene(path, port=None):
+    """Show a scene saved with save_scene, without tessellating and without importing OCP
+
+    The file is memory mapped and sent as is.
+
+    Parameters
+    - path:              The path of the scene file
+    - port:              The port the viewer listens to. Typically use 'set_port(port)' instead.
+                         A Viewer or a list of Viewers sends to their panels, see viewer.py
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a scene saved with save_scene")
+
+        # the viewer will hold the saved scene, see show
+        _forget(port)
+        if "ocp_vscode.lod" in sys.modules:
+            # refinement can only run when lod got imported by show
+            sys.modules["ocp_vscode.lod"].cancel_refinement()
+
+        responses = []
+        with memoryview(mm) as body:
+            try:
+                for target, sessions in _targets(port).items():
+                    r = comms.send(
+                        [body],
+                        "application/octet-stream",
+                        target,
+                        REQUEST_TIMEOUT / 1000,
+                        headers=_with_sessions({"X-OCP-Scene": "new"}, sessions),
+                    )
+                    responses.append(r)
+            except Exception as ex:
+                print(
+                    "Cannot connect to viewer, is it running and the right port provided?"
+                )
+                return
+
+    for r in responses:
+        if r.status_code != 201:
+            print("Error", r.text)
 
 
 def reset_show():
-    global OBJECTS
+    from .session import default_session
 
-    OBJECTS = {"objs": [], "names": [], "colors": [], "alphas": []}
+    default_session().reset_show()
 
 
 def show_object(
@@ -281,6 +1162,8 @@ def show_object(
     clear=False,
     port=None,
     progress="-+c",
+    binary=True,
+    quantize=False,
     **kwargs,
 ):
     """Incrementally show CAD objects in Visual Studio Code
@@ -295,9 +1178,13 @@ def show_object(
     - parent:           Add another object, usually the parent of e.g. edges or vertices with alpha=0.25
     - clear:            In interactice mode, clear the stack of objects to be shown
                         (typically used for the first object)
-    - port:             The port the viewer listens to. Typically use 'set_port(port)' instead
+    - port:             The port the viewer listens to. Typically use 'set_port(port)' instead.
+                        A Viewer or a list of Viewers sends to their panels, see viewer.py
     - progress:          Show progress of tessellation with None is no progress indicator. (default="-+c")
                          for object: "-": is reference, "+": gets tessellated, "c": from cache
+    - binary:           Send the meshes as binary buffers instead of hex encoded JSON (default=True)
+    - quantize:         With binary, send vertices as 16 bit integers, normals octahedral encoded and
+                        triangles as 16 bit indices where possible, about half the size (default=False)
 
     Valid keywords to configure the viewer (**kwargs):
     - axes:              Show axes (default=False)
@@ -318,42 +1205,26 @@ def show_object(
     - deviation:         Shapes: Deviation from linear deflection value (default=0.1)
     - angular_tolerance: Shapes: Angular deflection in radians for tessellation (default=0.2)
     - edge_accuracy:     Edges: Precision of edge discretization (default: mesh quality / 100)
+    - adaptive:          Shapes: Coarser tolerances for parts that are small compared to the scene (default=False)
+    - triangle_budget:   Shapes: With adaptive, scale tolerances until the scene has at most this
+                         many triangles (default=None)
+    - dedup:             Shapes: Tessellate solids with identical geometry once and send them as
+                         references with their location (default=True)
     - ambient_intensity  Intensity of ambient ligth (default=1.0)
     - direct_intensity   Intensity of direct lights (default=0.12)
     """
 
-    global OBJECTS
-
-    if clear:
-        reset_show()
+    from .session import default_session
 
-    if parent is not None:
-        OBJECTS["objs"].append(parent)
-        OBJECTS["names"].append("parent")
-        OBJECTS["colors"].append(get_default("default_color"))
-        OBJECTS["alphas"].append(0.25)
-
-    if options is None:
-        color = None
-        alpha = 1.0
-    else:
-        color = options.get("color")
-        alpha = options.get("alpha", 1.0)
-
-    OBJECTS["objs"].append(obj)
-    OBJECTS["names"].append(name)
-    OBJECTS["colors"].append(color)
-    OBJECTS["alphas"].append(alpha)
-
-    prefix = f"{name} " if name is not None else ""
-
-    print(f"\nshow_object {prefix}<{obj}>")
-    show(
-        *OBJECTS["objs"],
-        names=OBJECTS["names"],
-        colors=OBJECTS["colors"],
-        alphas=OBJECTS["alphas"],
+    return default_session().show_object(
+        obj,
+        name=name,
+        options=options,
+        parent=parent,
+        clear=clear,
         port=port,
         progress=progress,
+        binary=binary,
+        quantize=quantize,
         **kwargs,
     )
@@ -0,0 +1,57 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import io
+import platform
+import tempfile
+
+from OCP.BinTools import BinTools, BinTools_FormatVersion
+from OCP.TopExp import TopExp
+from OCP.TopTools import TopTools_IndexedMapOfShape
+
+
+def _serialize_brep(shape):
+    # without triangulations, they depend on whether the shape was tessellated before
+    args = (False, False, BinTools_FormatVersion.BinTools_FormatVersion_CURRENT)
+    if platform.system() == "Darwin":
+        with tempfile.NamedTemporaryFile() as tf:
+            BinTools.Write_s(shape, tf.name, *args)
+            with open(tf.name, "rb") as fd:
+                return fd.read()
+
+    bio = io.BytesIO()
+    BinTools.Write_s(shape, bio, *args)
+    return bio.getvalue()
+
+
+def shape_hash(shape):
+    """Hash of the serialized BRep, equal for geometrically identical shapes"""
+    # BRepMesh resets the checked flag of the faces it meshes and the flags get
+    # serialized, so hash all sub shapes as unchecked and restore the flags after
+    sub_shapes = TopTools_IndexedMapOfShape()
+    TopExp.MapShapes_s(shape, sub_shapes)
+    tshapes = [
+        sub_shapes.FindKey(i).TShape() for i in range(1, sub_shapes.Extent() + 1)
+    ]
+    checked = [tshape.Checked() for tshape in tshapes]
+    try:
+        for tshape in tshapes:
+            tshape.Checked(False)
+        return hashlib.blake2b(_serialize_brep(shape), digest_size=16).hexdigest()
+    finally:
+        for tshape, flag in zip(tshapes, checked):
+            tshape.Checked(flag)
@@ -0,0 +1,75 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Handles of viewer panels, addressed by port and session
+
+The command server of the extension opens one panel per session, a message
+names its sessions in the X-OCP-Session header. A Viewer, or a list of Viewers,
+can be passed as port to show, show_async, show_config, load_scene and
+Animation.animate. A message for several viewers is encoded once, and viewers
+on the same port share one request:
+
+    a, b = Viewer(session="variant a"), Viewer(session="variant b")
+    a.show(variant_a)
+    b.show(variant_b)
+    show(common_part, port=[a, b])
+
+Connections are kept alive per thread and port by comms.py.
+"""
+
+from .show import load_scene, show, show_config
+
+
+class Viewer:
+    """A viewer panel
+    Parameters
+    - port:    The port the command server listens to, None uses the port of set_port
+    - session: Name of the panel, None is the default panel of the port
+    """
+
+    def __init__(self, port=None, session=None):
+        if session is not None and (
+            not isinstance(session, str) or "," in session or not session.isprintable()
+        ):
+            raise ValueError("A session needs to be a printable string without ','")
+
+        self.port = port
+        self.session = session
+
+    def __repr__(self):
+        return f"Viewer(port={self.port!r}, session={self.session!r})"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Viewer)
+            and self.port == other.port
+            and self.session == other.session
+        )
+
+    def __hash__(self):
+        return hash((self.port, self.session))
+
+    def show(self, *cad_objs, **kwargs):
+        """Show CAD objects in this viewer, see show"""
+        return show(*cad_objs, port=self, **kwargs)
+
+    def show_config(self, **kwargs):
+        """Change the settings of this viewer, see show_config"""
+        return show_config(port=self, **kwargs)
+
+    def load_scene(self, path):
+        """Show a saved scene in this viewer, see load_scene"""
+        return load_scene(path, port=self)
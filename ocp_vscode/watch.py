@@ -0,0 +1,322 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Watch mode, re-run a CAD script on every change and show only what changed
+
+    python -m ocp_vscode.watch model.py [--port 3939] [--session name]
+
+The script runs in this interpreter, so OCP, the CAD library and the caches stay
+loaded between runs. Modules imported from the directory of the script get
+reloaded when they change. The calls of show, show_object and reset_show in
+the script are collected instead of sent. After a run the objects are compared
+with the ones of the previous run by the hash of their BRep, see
+utils.shape_hash: unchanged objects stay in the viewer, changed ones get
+tessellated and sent in one update message.
+"""
+
+import argparse
+import hashlib
+import os
+import runpy
+import sys
+import time
+import traceback
+
+import ocp_vscode
+
+from .show import Progress, _object_key, _update
+from .viewer import Viewer
+
+# seconds between two checks of the watched files
+INTERVAL = 0.5
+
+# keywords of show and show_object that make no sense in watch mode
+_IGNORED = ("port", "block", "profile", "lod")
+
+
+class _Collector:
+    """Stand-ins for show, show_object and reset_show while the script runs"""
+
+    def __init__(self):
+        self.objects = []
+        self.stack = []
+        self.kwargs = {}
+
+    def _keep(self, kwargs):
+        self.kwargs = {k: v for k, v in kwargs.items() if k not in _IGNORED}
+
+    def show(self, *cad_objs, names=None, colors=None, alphas=None, **kwargs):
+        n = len(cad_objs)
+        self.objects = list(
+            zip(
+                cad_objs,
+                [None] * n if names is None else names,
+                [None] * n if colors is None else colors,
+                [None] * n if alphas is None else alphas,
+            )
+        )
+        self._keep(kwargs)
+
+    def show_object(
+        self, obj, name=None, options=None, parent=None, clear=False, **kwargs
+    ):
+        from ocp_tessellate.defaults import get_default
+
+        if clear:
+            self.reset_show()
+        if parent is not None:
+            self.stack.append((parent, "parent", get_default("default_color"), 0.25))
+        if options is None:
+            options = {}
+        self.stack.append((obj, name, options.get("color"), options.get("alpha", 1.0)))
+        self.objects = list(self.stack)
+        self._keep(kwargs)
+
+    def reset_show(self):
+        self.stack = []
+
+
+def _combine(hashes):
+    if any(h is None for h in hashes):
+        return None
+    return hashlib.blake2b(repr(hashes).encode(), digest_size=16).hexdigest()
+
+
+def _object_hash(obj):
+    """Geometric hash of a CAD object, None if it cannot be hashed"""
+    from ocp_tessellate.ocp_utils import is_cadquery, is_topods_shape
+
+    from .utils import shape_hash
+
+    if is_topods_shape(obj):
+        return shape_hash(obj)
+
+    if is_cadquery(obj):
+        return _combine([_object_hash(value) for value in obj.vals()])
+
+    if isinstance(obj, (list, tuple)):
+        return _combine([_object_hash(value) for value in obj])
+
+    wrapped = getattr(obj, "wrapped", None)
+    if is_topods_shape(wrapped):
+        # build123d shapes carry label and color, compounds also children
+        children = getattr(obj, "children", ())
+        return _combine(
+            [
+                shape_hash(wrapped),
+                str(getattr(obj, "label", "")),
+                str(getattr(obj, "color", "")),
+                *[_object_hash(child) for child in children],
+            ]
+        )
+
+    # assemblies, locations, axes, ... get shown again on every run
+    return None
+
+
+class Watcher:
+    """Runs a script on every change and updates a viewer incrementally
+    Parameters
+    - path:     The path of the script
+    - port:     The port the viewer listens to, a Viewer or a list of Viewers
+                (default=None, the port of set_port)
+    - interval: Seconds between two checks of the watched files (default=0.5)
+    """
+
+    def __init__(self, path, port=None, interval=INTERVAL):
+        self.path = os.path.abspath(path)
+        self.directory = os.path.dirname(self.path)
+        self.port = port
+        self.interval = interval
+
+        # hashes, keys and objects of the last run, in the order they were shown
+        self.previous = []
+        self.kwargs = None
+        self.first = True
+        # modules imported before the first run never get reloaded
+        self.preloaded = set(sys.modules)
+        self.mtimes = {}
+
+    def _local_modules(self):
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, "__file__", None)
+            if (
+                name not in self.preloaded
+                and filename is not None
+                and os.path.abspath(filename).startswith(self.directory + os.sep)
+            ):
+                yield name, os.path.abspath(filename)
+
+    def _files(self):
+        return [self.path] + [filename for _, filename in self._local_modules()]
+
+    def _mtimes(self):
+        mtimes = {}
+        for filename in self._files():
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime_ns
+            except OSError:
+                # e.g. while an editor replaces the file
+                pass
+        return mtimes
+
+    def changed(self):
+        """Whether a watched file changed since the last run"""
+        return self._mtimes() != self.mtimes
+
+    def _execute(self):
+        collector = _Collector()
+        originals = {
+            name: getattr(ocp_vscode, name)
+            for name in ("show", "show_object", "reset_show")
+        }
+
+        for name, _ in list(self._local_modules()):
+            del sys.modules[name]
+        if self.directory not in sys.path:
+            sys.path.insert(0, self.directory)
+
+        argv = sys.argv
+        try:
+            for name in originals:
+                setattr(ocp_vscode, name, getattr(collector, name))
+            sys.argv = [self.path]
+            runpy.run_path(self.path, run_name="__main__")
+        finally:
+            sys.argv = argv
+            for name, value in originals.items():
+                setattr(ocp_vscode, name, value)
+
+        return collector
+
+    def run(self):
+        """Run the script once and show the objects that changed since the last run"""
+        before = self._mtimes()
+        print(f"\nRunning {self.path}")
+
+        start = time.time()
+        try:
+            collector = self._execute()
+        except (Exception, SystemExit):
+            traceback.print_exc()
+            return None
+        finally:
+            # modules imported by this run get watched from now on, with the
+            # modification times from before the run for the known files
+            self.mtimes = {f: before.get(f, m) for f, m in self._mtimes().items()}
+        executed = time.time() - start
+
+        kwargs = dict(collector.kwargs)
+        progress = kwargs.pop("progress", "-+c")
+        if not self.first:
+            kwargs.setdefault("reset_camera", False)
+
+        # unchanged objects get replaced by the ones of the previous run, so that
+        # _update finds them in the viewer by identity
+        unused = list(self.previous)
+        objects, current = [], []
+        changed = 0
+        for obj, name, color, alpha in collector.objects:
+            h = _object_hash(obj)
+            key = _object_key(name, color, alpha, kwargs)
+            match = next(
+                (
+                    i
+                    for i, (p, k, _) in enumerate(unused)
+                    if h is not None and p == h and k == key
+                ),
+                None,
+            )
+            if match is None:
+                changed += 1
+            else:
+                obj = unused.pop(match)[2]
+            objects.append((obj, name, color, alpha))
+            current.append((h, key, obj))
+
+        if changed == 0 and not unused and collector.kwargs == self.kwargs:
+            print(f"No changes, run: {executed:7.3f} sec")
+            return 0
+        self.previous, self.kwargs = current, collector.kwargs
+
+        try:
+            _update(
+                *[obj for obj, _, _, _ in objects],
+                names=[name for _, name, _, _ in objects],
+                colors=[color for _, _, color, _ in objects],
+                alphas=[alpha for _, _, _, alpha in objects],
+                port=self.port,
+                progress=Progress([] if progress is None else [c for c in progress]),
+                keep_all=True,
+                **kwargs,
+            )
+        except Exception:
+            traceback.print_exc()
+            # the viewer state is unknown, start from scratch next time
+            self.previous, self.kwargs = [], None
+            return None
+
+        self.first = False
+        if changed and progress:
+            # end the line of progress marks
+            print()
+        print(
+            f"{changed} of {len(objects)} objects changed, "
+            f"run: {executed:7.3f} sec, overall: {time.time() - start:7.3f} sec"
+        )
+        return changed
+
+    def watch(self):
+        """Run the script on every change until interrupted"""
+        self.run()
+        print(f"\nWatching {self.path}, stop with Ctrl-C")
+        try:
+            while True:
+                time.sleep(self.interval)
+                if self.changed():
+                    self.run()
+        except KeyboardInterrupt:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ocp_vscode.watch",
+        description="Re-run a CAD script on every change and show only the "
+        "objects that changed in OCP CAD Viewer",
+    )
+    parser.add_argument("script", help="the CAD script to watch")
+    parser.add_argument(
+        "--port", type=int, default=None, help="port of the viewer (default: 3939)"
+    )
+    parser.add_argument(
+        "--session", default=None, help="name of the viewer panel (default: none)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=INTERVAL,
+        help=f"seconds between two checks for changes (default: {INTERVAL})",
+    )
+    args = parser.parse_args(argv)
+
+    Watcher(
+        args.script, port=Viewer(args.port, args.session), interval=args.interval
+    ).watch()
+
+
+if __name__ == "__main__":
+    main()
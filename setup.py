@@ -10,6 +10,9 @@ setup_args = {
     "install_requires": ["ocp-tessellate>=1.0.0rc9", "requests", "orjson"],
     "packages": find_packages(),
     "zip_safe": False,
+    "entry_points": {
+        "console_scripts": ["ocp_vscode_watch = ocp_vscode.watch:main"],
+    },
     "author": "Bernhard Walter",
     "author_email": "b_walter@arcor.de",
     "url": "https://github.com/bernhard-42/vscode-cadquery-viewer",
@@ -0,0 +1,197 @@
+/*
+   Copyright 2023 Bernhard Walter
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+*/
+
+// Meshes of binary messages, keyed by the hash the Python side computed (see
+// ocp_vscode/binary.py), and the messages of the last scene of every session.
+// Both live in the extension host and survive the webviews and the controller,
+// so re-showing unchanged parts sends hashes only and a re-created panel gets
+// its scene back. The meshes are shared by all sessions.
+
+export interface CachedMesh {
+    // the mesh as sent, with blob offsets relative to data
+    mesh: any;
+    data: Uint8Array;
+}
+
+export interface SceneMessage {
+    body: Uint8Array;
+    cached: { [hash: string]: CachedMesh };
+}
+
+import { TextDecoder } from "util";
+
+const MAGIC = "OCPB";
+const ALIGN = 8;
+
+function parseHeader(body: Uint8Array): { header: any; start: number } | undefined {
+    if (body.length < 8 || String.fromCharCode(...body.subarray(0, 4)) !== MAGIC) {
+        return undefined;
+    }
+    const view = new DataView(body.buffer, body.byteOffset, body.byteLength);
+    const prefix = 8 + view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(body.subarray(8, prefix)));
+    return { header: header, start: prefix + ((ALIGN - (prefix % ALIGN)) % ALIGN) };
+}
+
+function isBlob(value: any): boolean {
+    return (
+        value !== null &&
+        typeof value === "object" &&
+        value.offset !== undefined &&
+        value.length !== undefined &&
+        value.dtype !== undefined
+    );
+}
+
+export class GeometryCache {
+    private meshes = new Map<string, CachedMesh>(); // oldest first
+    private size = 0;
+    // the last scene per session, complete is false after a message of the scene
+    // was dropped, until the next scene starts
+    private scenes = new Map<
+        string,
+        { messages: SceneMessage[]; size: number; complete: boolean }
+    >();
+
+    constructor(public maxSize: number) {}
+
+    public known(hashes: string[]): string[] {
+        return hashes.filter((hash) => this.meshes.has(hash));
+    }
+
+    private get(hash: string): CachedMesh | undefined {
+        const entry = this.meshes.get(hash);
+        if (entry !== undefined) {
+            // move to the end, eviction removes the least recently used
+            this.meshes.delete(hash);
+            this.meshes.set(hash, entry);
+        }
+        return entry;
+    }
+
+    private store(sent: any, body: Uint8Array, start: number) {
+        const keys = Object.keys(sent).filter((key) => isBlob(sent[key]));
+        let first = 0;
+        let end = 0;
+        if (keys.length > 0) {
+            first = Math.min(...keys.map((key) => sent[key].offset));
+            end = Math.max(...keys.map((key) => sent[key].offset + sent[key].length));
+        }
+        if (end - first > this.maxSize || this.meshes.has(sent.hash)) {
+            return;
+        }
+
+        const mesh = Object.assign({}, sent);
+        for (const key of keys) {
+            mesh[key] = Object.assign({}, sent[key], { offset: sent[key].offset - first });
+        }
+        // a copy with its own (8 byte aligned) buffer, the body can be dropped
+        const data = new Uint8Array(body.subarray(start + first, start + end));
+        this.meshes.set(sent.hash, { mesh: mesh, data: data });
+        this.size += data.length;
+
+        for (const [hash, entry] of this.meshes) {
+            if (this.size <= this.maxSize) {
+                break;
+            }
+            this.meshes.delete(hash);
+            this.size -= entry.data.length;
+        }
+    }
+
+    /**
+     * Cache the meshes of a message and collect the cached meshes it refers to,
+     * meshes are the instances and the leaves of the shapes tree.
+     * Returns the hashes that are not cached (any more) as missing, the message
+     * cannot be shown then.
+     */
+    public add(body: Uint8Array): { cached: { [hash: string]: CachedMesh }; missing: string[] } {
+        const cached: { [hash: string]: CachedMesh } = {};
+        const missing: string[] = [];
+
+        const parsed = parseHeader(body);
+        const data = parsed?.header.data;
+        if (parsed === undefined || data === null || typeof data !== "object") {
+            return { cached: cached, missing: missing };
+        }
+        const meshes: any[] = [...(data.instances || [])];
+        (function walk(obj: any) {
+            if (obj === null || typeof obj !== "object") {
+                return;
+            } else if (obj.parts !== undefined) {
+                obj.parts.forEach(walk);
+            } else if (obj.type === "shapes" && obj.shape?.hash !== undefined) {
+                meshes.push(obj.shape);
+            }
+        })(data.shapes);
+
+        for (const mesh of meshes) {
+            if (mesh.hash === undefined) {
+                continue;
+            } else if (mesh.vertices === undefined) {
+                const entry = this.get(mesh.hash);
+                if (entry === undefined) {
+                    missing.push(mesh.hash);
+                } else {
+                    cached[mesh.hash] = entry;
+                }
+            } else {
+                this.store(mesh, body, parsed.start);
+            }
+        }
+        return { cached: cached, missing: missing };
+    }
+
+    /**
+     * Keep a message to restore the scene of a session, "new" starts a scene,
+     * "add" extends it. Scenes larger than the cache are not kept.
+     * Returns whether the message was kept.
+     */
+    public record(message: SceneMessage, scene: string | undefined, session = ""): boolean {
+        let last = this.scenes.get(session);
+        if (last === undefined || scene === "new") {
+            last = { messages: [], size: 0, complete: scene === "new" };
+            this.scenes.set(session, last);
+        } else if (scene !== "add") {
+            // an older client, the scene is unknown
+            last.complete = false;
+        }
+        if (!last.complete) {
+            last.messages = [];
+            last.size = 0;
+            return false;
+        }
+        last.messages.push(message);
+        last.size += message.body.length;
+        if (last.size > this.maxSize) {
+            last.complete = false;
+            last.messages = [];
+            last.size = 0;
+        }
+        return last.complete;
+    }
+
+    public lastScene(session = ""): SceneMessage[] {
+        return this.scenes.get(session)?.messages || [];
+    }
+
+    public restorable(session = ""): boolean {
+        // whether lastScene holds all messages of the last scene
+        return this.scenes.get(session)?.complete === true;
+    }
+}
+
+export const geometryCache = new GeometryCache(0);
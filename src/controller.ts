@@ -16,20 +16,97 @@
 */
 
 import * as vscode from "vscode";
-import { CadqueryViewer } from "./viewer";
+import { CadqueryViewer, DEFAULT_SESSION } from "./viewer";
 import { template } from "./display";
 import { createServer, IncomingMessage, Server, ServerResponse } from "http";
+import { createGunzip } from "zlib";
+import * as fs from "fs";
 import * as output from "./output";
 import { logo } from "./logo";
 import { StatusManagerProvider } from "./statusManager";
+import { geometryCache, SceneMessage } from "./cache";
 
 var serverStarted = false;
 
+// milliseconds to wait for the webview to report its timings
+const TIMINGS_TIMEOUT = 60000;
+
+// The epoch of a panel changes when it lost the objects it showed: with a new
+// extension host, or when its webview was re-created without the complete last
+// scene. Incremental updates of the Python side name the epochs they were
+// computed for and get rejected after a change, see ocp_vscode/show.py _update.
+const INSTANCE = Date.now().toString(36);
+const generations = new Map<string, number>();
+
+function epoch(session: string): string {
+    return `${INSTANCE}.${generations.get(session) || 0}`;
+}
+
+function newEpoch(session: string) {
+    generations.set(session, (generations.get(session) || 0) + 1);
+}
+
+interface PendingTimings {
+    res: ServerResponse;
+    epochs: string;
+    timings: { [stage: string]: number };
+    timeout: NodeJS.Timeout;
+}
+
+function setting(name: string, fallback: number): number {
+    // sizes are configured in MB
+    return (
+        (vscode.workspace.getConfiguration("OcpCadViewer").get<number>(name) || fallback) *
+        1024 *
+        1024
+    );
+}
+
+function sessions(header: string | string[] | undefined): string[] {
+    // the sessions a message goes to, an empty name is the default panel
+    if (header === undefined) {
+        return [DEFAULT_SESSION];
+    }
+    const names = String(header).split(",");
+    return [...new Set(names.map((session) => decodeSession(session.trim())))];
+}
+
+function decodeSession(session: string): string {
+    // the Python side percent encodes the names, header values are latin-1 only
+    try {
+        return decodeURIComponent(session);
+    } catch (error) {
+        return session;
+    }
+}
+
+function stale(header: string | string[] | undefined, targets: string[]): boolean {
+    // the epochs are listed in the order of the sessions, empty ones are not checked
+    if (header === undefined) {
+        return false;
+    }
+    const expected = String(header).split(",").map((value) => value.trim());
+    return targets.some((session, i) => {
+        const value = expected[i];
+        return value !== undefined && value !== "" && value !== epoch(session);
+    });
+}
+
+function ownBuffer(body: Buffer): Uint8Array {
+    // small buffers share Node's buffer pool, the webview should only get the message
+    if (body.byteOffset === 0 && body.buffer.byteLength === body.length) {
+        return new Uint8Array(body.buffer);
+    }
+    return new Uint8Array(body);
+}
+
 export class CadqueryController {
     server: Server | undefined;
+    socketServer: Server | undefined;
     statusController: StatusManagerProvider;
-    view: vscode.Webview | undefined;
     port: number;
+    pending = new Map<number, PendingTimings>();
+    requestId = 0;
 
     constructor(
         private context: vscode.ExtensionContext,
@@ -43,11 +120,7 @@ export class CadqueryController {
             if (this.startCommandServer(this.port)) {
                 output.info("Starting web server ...");
                 serverStarted = true;
-                CadqueryViewer.createOrShow(this.context.extensionUri, this);
-                CadqueryViewer.currentPanel?.update(template());
-
-                let panel = CadqueryViewer.currentPanel;
-                this.view = panel?.getView();
+                this.panel(DEFAULT_SESSION);
             }
         }
     }
@@ -57,37 +130,249 @@ export class CadqueryController {
     }
 
     public logo() {
-        this.view?.postMessage(logo);
+        CadqueryViewer.currentPanel?.getView().postMessage(logo);
     }
 
-    public startCommandServer(port: number): boolean {
-        this.server = createServer(
-            (req: IncomingMessage, res: ServerResponse) => {
-                let response = "";
-                if (req.method === "GET") {
-                    response = "Only POST supported\n";
-                    res.writeHead(200, {
-                        "Content-Length": response.length,
-                        "Content-Type": "text/plain"
-                    });
+    private panel(session: string): { view: vscode.Webview; created: boolean } {
+        let panel = CadqueryViewer.panels.get(session);
+        const created = panel === undefined;
+        if (panel === undefined) {
+            // every session gets its own panel, e.g. to compare variants side by side
+            CadqueryViewer.createOrShow(this.context.extensionUri, this, session);
+            panel = CadqueryViewer.panels.get(session)!;
+            panel.update(template());
+        }
+        return { view: panel.getView(), created: created };
+    }
+
+    private post(
+        session: string,
+        message: SceneMessage,
+        scene: string | undefined,
+        id: number | null = null
+    ): Thenable<boolean> | undefined {
+        const kept = geometryCache.record(message, scene, session);
+        const { view, created } = this.panel(session);
+        if (created && kept) {
+            // a new panel gets the kept scene with replay, once it is ready
+            return undefined;
+        }
+        return view.postMessage({ id: id, ...message });
+    }
+
+    private handleRequest(req: IncomingMessage, res: ServerResponse) {
+        let response = "";
+        if (req.method === "GET") {
+            response = "Only POST supported\n";
+            res.writeHead(200, {
+                "Content-Length": response.length,
+                "Content-Type": "text/plain",
+                // lets the Python side negotiate the compression of the body
+                "Accept-Encoding": "gzip",
+                // and ask for cached meshes, see answerHashes
+                "X-OCP-Features": "hashes"
+            });
+            res.end(response);
+        } else if (req.method === "POST") {
+            const start = Date.now();
+            const maxSize = setting("maxMessageSize", 1024);
+
+            let stream: NodeJS.ReadableStream = req;
+            const gzipped = req.headers["content-encoding"] === "gzip";
+            if (gzipped) {
+                stream = req.pipe(createGunzip());
+            }
+
+            // with a known size the chunks are copied into one buffer right away,
+            // otherwise they are collected and concatenated once at the end
+            const contentLength = Number(req.headers["content-length"]);
+            let tooLarge = contentLength > maxSize;
+            let body: Buffer | undefined =
+                !gzipped && contentLength > 0 && !tooLarge
+                    ? Buffer.allocUnsafeSlow(contentLength)
+                    : undefined;
+            var chunks: Buffer[] = [];
+            var size = 0;
+            stream.on("data", (chunk: Buffer) => {
+                if (size + chunk.length > maxSize) {
+                    // drain the request, but drop its content
+                    tooLarge = true;
+                    chunks = [];
+                    body = undefined;
+                }
+                if (!tooLarge) {
+                    if (body !== undefined && size + chunk.length <= body.length) {
+                        chunk.copy(body, size);
+                    } else {
+                        chunks.push(chunk);
+                    }
+                }
+                size += chunk.length;
+            });
+
+            stream.on("error", (error: Error) => {
+                output.error(`Cannot read model: ${error.message}`);
+                response = error.message;
+                res.writeHead(400, { "Content-Type": "text/plain" });
+                res.end(response);
+            });
+
+            stream.on("end", () => {
+                if (tooLarge) {
+                    response = `Model of ${size} bytes exceeds OcpCadViewer.maxMessageSize`;
+                    output.error(response);
+                    res.writeHead(413, { "Content-Type": "text/plain" });
                     res.end(response);
-                } else if (req.method === "POST") {
-                    var json = "";
-                    req.on("data", (chunk: string) => {
-                        json += chunk;
+                    return;
+                }
+                if (body === undefined || chunks.length > 0) {
+                    body = Buffer.concat(body === undefined ? chunks : [body, ...chunks]);
+                } else if (size < body.length) {
+                    body = body.subarray(0, size);
+                }
+                if (req.url === "/hashes") {
+                    this.answerHashes(body, res);
+                    return;
+                }
+                output.debug("Received a new model");
+                const received = Date.now();
+
+                const targets = sessions(req.headers["x-ocp-session"]);
+                const epochs = targets.map(epoch).join(",");
+                if (stale(req.headers["x-ocp-epoch"], targets)) {
+                    output.debug("Rejected an update for objects the viewer lost");
+                    response = "The viewer does not hold the objects to update any more";
+                    res.writeHead(412, {
+                        "Content-Type": "text/plain",
+                        "X-OCP-Epoch": epochs
                     });
+                    res.end(response);
+                    return;
+                }
 
-                    req.on("end", () => {
-                        output.debug("Received a new model");
-                        this.view?.postMessage(json);
-                        output.debug("Posted model to view");
-                        response = "done";
-                        res.writeHead(201, { "Content-Type": "text/plain" });
-                        res.end(response);
+                // meshes sent as hash only are added from the cache
+                geometryCache.maxSize = setting("cacheSize", 256);
+                const { cached, missing } = geometryCache.add(body);
+                if (missing.length > 0) {
+                    output.debug(`${missing.length} meshes are not cached any more`);
+                    response = JSON.stringify({ missing: missing });
+                    res.writeHead(409, { "Content-Type": "application/json" });
+                    res.end(response);
+                    return;
+                }
+                const message = { body: ownBuffer(body), cached: cached };
+                const scene = req.headers["x-ocp-scene"] as string | undefined;
+
+                // the webview tells binary and JSON messages apart by their first bytes
+                const timings = req.headers["x-ocp-timings"] !== undefined;
+                const id = timings ? ++this.requestId : null;
+                // one message can go to several panels, the first one reports timings
+                const forwarded = targets.map((session, i) =>
+                    this.post(session, message, scene, i === 0 ? id : null)
+                )[0];
+                output.debug("Posted model to view");
+
+                if (id === null || forwarded === undefined) {
+                    response = "done";
+                    res.writeHead(201, {
+                        "Content-Type": "text/plain",
+                        "X-OCP-Epoch": epochs
                     });
+                    res.end(response);
+                    return;
                 }
+
+                const pending: PendingTimings = {
+                    res: res,
+                    epochs: epochs,
+                    timings: { receive: received - start },
+                    timeout: setTimeout(() => this.reportTimings({ id: id }), TIMINGS_TIMEOUT)
+                };
+                this.pending.set(id, pending);
+                forwarded.then(() => {
+                    pending.timings.forward = Date.now() - received;
+                });
+            });
+        }
+    }
+
+    private answerHashes(body: Buffer, res: ServerResponse) {
+        // the hashes of the list the Python side asks for that are cached
+        let response: string;
+        try {
+            response = JSON.stringify(geometryCache.known(JSON.parse(body.toString())));
+        } catch (error) {
+            res.writeHead(400, { "Content-Type": "text/plain" });
+            res.end(`${error}`);
+            return;
+        }
+        res.writeHead(200, { "Content-Type": "application/json" });
+        res.end(response);
+    }
+
+    public loadScene(body: Uint8Array) {
+        // a file of save_scene holds a binary message, it replaces the scene
+        geometryCache.maxSize = setting("cacheSize", 256);
+        const { cached } = geometryCache.add(body);
+        // the Python side does not know the scene of the file
+        newEpoch(DEFAULT_SESSION);
+        this.post(DEFAULT_SESSION, { body: body, cached: cached }, "new");
+    }
+
+    public replay(session: string) {
+        // a new webview gets the messages of the last scene of its session again
+        const scene = geometryCache.lastScene(session);
+        if (!geometryCache.restorable(session)) {
+            newEpoch(session);
+        }
+        if (scene.length > 0) {
+            output.debug(`Restoring the last scene from ${scene.length} messages`);
+        }
+        const view = CadqueryViewer.panels.get(session)?.getView();
+        for (const message of scene) {
+            view?.postMessage({ id: null, ...message });
+        }
+    }
+
+    public reportTimings(message: any) {
+        // called with the timings of the webview, responds to the waiting POST
+        const pending = this.pending.get(message.id);
+        if (pending === undefined) {
+            return;
+        }
+        this.pending.delete(message.id);
+        clearTimeout(pending.timeout);
+
+        for (const stage of ["decode", "render"]) {
+            if (message[stage] !== undefined) {
+                pending.timings[stage] = message[stage];
             }
-        );
+        }
+        const response = JSON.stringify(pending.timings);
+        pending.res.writeHead(201, {
+            "Content-Type": "application/json",
+            "X-OCP-Epoch": pending.epochs
+        });
+        pending.res.end(response);
+    }
+
+    public startSocketServer(socketPath: string) {
+        // remove a stale socket file of an earlier session
+        if (fs.existsSync(socketPath)) {
+            fs.unlinkSync(socketPath);
+        }
+        this.socketServer = createServer(this.handleRequest.bind(this));
+        this.socketServer.on("error", (error) => {
+            vscode.window.showErrorMessage(`${error}`);
+        });
+        this.socketServer.on("listening", () => {
+            output.info(`Command server is listening on socket ${socketPath}`);
+        });
+        this.socketServer.listen(socketPath);
+    }
+
+    public startCommandServer(port: number): boolean {
+        this.server = createServer(this.handleRequest.bind(this));
         this.server.on("error", (error) => {
             let msg = "";
             if (error.message.indexOf("EADDRINUSE") > 0) {
@@ -104,6 +389,13 @@ export class CadqueryController {
             );
         });
         this.server.listen(port);
+
+        const socketPath = vscode.workspace
+            .getConfiguration("OcpCadViewer")
+            .get<string>("socket");
+        if (socketPath) {
+            this.startSocketServer(socketPath);
+        }
         return this.server.address() !== null;
     }
 
@@ -111,6 +403,7 @@ export class CadqueryController {
         output.debug("CadqueryController dispose");
 
         this.server?.close();
+        this.socketServer?.close();
         serverStarted = false;
         output.info("Server is shut down");
         this.statusController.refresh("<none>");
@@ -39,6 +39,7 @@ export function template() {
 
     <script type="module">
         import { Viewer, Timer } from "https://unpkg.com/three-cad-viewer@1.7.0/dist/three-cad-viewer.esm.js";
+        const vscode = acquireVsCodeApi();
         var viewer = null;
         var _shapes = null;
         var _states = null;
@@ -69,12 +70,112 @@ export function template() {
             return i === bytes.length ? bytes : bytes.slice(0, i);
         }
 
-        function decode(data) {
-            function convert(obj) {
+        const TYPED_ARRAYS = {
+            float32: Float32Array,
+            float64: Float64Array,
+            uint32: Uint32Array,
+            uint16: Uint16Array,
+            int16: Int16Array,
+            uint8: Uint8Array,
+        };
+
+        function aligned(message) {
+            const bytes = (message instanceof ArrayBuffer)
+                ? new Uint8Array(message)
+                : new Uint8Array(message.buffer, message.byteOffset, message.byteLength);
+            // typed array views need aligned offsets
+            return (bytes.byteOffset % 8 !== 0) ? bytes.slice() : bytes;
+        }
+
+        function fromBinary(message) {
+            // "OCPB" | header length (uint32 LE) | JSON header | padding | blobs
+            const bytes = aligned(message);
+            const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+            const headerLength = view.getUint32(4, true);
+            const header = new TextDecoder().decode(bytes.subarray(8, 8 + headerLength));
+            const start = 8 + headerLength;
+            const data = JSON.parse(header);
+            const blobs = {
+                buffer: bytes.buffer,
+                offset: bytes.byteOffset + start + ((8 - (start % 8)) % 8)
+            };
+            return [data, blobs];
+        }
+
+        function dequantize(values, quantization) {
+            // 16 bit positions relative to the bounding box, see binary.py
+            const offset = quantization.offset;
+            const scale = quantization.scale;
+            const result = new Float32Array(values.length);
+            for (let i = 0; i < values.length; i += 3) {
+                result[i] = offset[0] + values[i] * scale[0];
+                result[i + 1] = offset[1] + values[i + 1] * scale[1];
+                result[i + 2] = offset[2] + values[i + 2] * scale[2];
+            }
+            return result;
+        }
+
+        function fromOctahedral(values) {
+            // 2 x int16 per normal, see binary.py
+            const result = new Float32Array((values.length / 2) * 3);
+            for (let i = 0, j = 0; i < values.length; i += 2, j += 3) {
+                let x = values[i] / 32767;
+                let y = values[i + 1] / 32767;
+                const z = 1 - Math.abs(x) - Math.abs(y);
+                const t = Math.max(-z, 0);
+                x += x >= 0 ? -t : t;
+                y += y >= 0 ? -t : t;
+                const length = Math.sqrt(x * x + y * y + z * z) || 1;
+                result[j] = x / length;
+                result[j + 1] = y / length;
+                result[j + 2] = z / length;
+            }
+            return result;
+        }
+
+        function decode(data, blobs, cached) {
+            function convert(obj, source = blobs) {
+                if (source !== undefined && obj.offset !== undefined) {
+                    const TypedArray = TYPED_ARRAYS[obj.dtype] || Float32Array;
+                    return new TypedArray(
+                        source.buffer,
+                        source.offset + obj.offset,
+                        obj.length / TypedArray.BYTES_PER_ELEMENT
+                    );
+                }
                 let buffer = fromHex(obj.buffer);
                 return new Float32Array(buffer.buffer);
             }
+
+            function convertMesh(mesh, source = blobs) {
+                mesh.vertices = convert(mesh.vertices, source);
+                mesh.normals = convert(mesh.normals, source);
+                mesh.edges = convert(mesh.edges, source);
+                if (mesh.triangles.offset !== undefined) {
+                    // 16 or 32 bit indices, the viewer expects 32 bit
+                    mesh.triangles = Uint32Array.from(convert(mesh.triangles, source));
+                }
+                if (mesh.quantization !== undefined) {
+                    mesh.vertices = dequantize(mesh.vertices, mesh.quantization);
+                    mesh.edges = dequantize(mesh.edges, mesh.quantization);
+                    mesh.normals = fromOctahedral(mesh.normals);
+                    delete mesh.quantization;
+                }
+            }
         
+            function resolveMesh(mesh) {
+                let source = blobs;
+                if (mesh.vertices === undefined && mesh.hash !== undefined) {
+                    // sent as hash only, the command server added the mesh, see cache.ts
+                    const entry = cached[mesh.hash];
+                    mesh = Object.assign({}, entry.mesh);
+                    const bytes = aligned(entry.data);
+                    source = { buffer: bytes.buffer, offset: bytes.byteOffset };
+                }
+                convertMesh(mesh, source);
+                return mesh;
+            }
+
             function walk(obj) {
                 var type = null;
                 for (var attr in obj) {
@@ -89,9 +190,7 @@ export function template() {
                     } else if (attr === "shape") {
                         if (type === "shapes") {
                             if (obj.shape.ref === undefined) {
-                                obj.shape.vertices = convert(obj.shape.vertices);
-                                obj.shape.normals = convert(obj.shape.normals);
-                                obj.shape.edges = convert(obj.shape.edges);
+                                obj.shape = resolveMesh(obj.shape);
                             } else {
                                 const ind = obj.shape.ref;
                                 if (ind !== undefined) {
@@ -105,18 +204,40 @@ export function template() {
                 }
             }
 
-            const instances = data.data.instances;
-            
-            data.data.instances.forEach((instance) => {
-                instance.vertices = convert(instance.vertices);
-                instance.normals = convert(instance.normals);
-                instance.edges = convert(instance.edges);
-                instance.triangles = Uint32Array.from(instance.triangles);
+            const instances = data.data.instances.map((instance) => {
+                instance = resolveMesh(instance);
+                if (Array.isArray(instance.triangles)) {
+                    instance.triangles = Uint32Array.from(instance.triangles);
+                }
+                return instance;
             });
 
             walk(data.data.shapes);
             
             data.data.instances = []
+            return instances;
+        }
+
+        function decodeTrack(track, blobs) {
+            // [path, action, times, values] with float32 buffers, see animation.py
+            let [path, action, times, values] = track;
+            if (times.offset === undefined) {
+                return track;
+            }
+            times = new Float32Array(blobs.buffer, blobs.offset + times.offset, times.length / 4);
+            values = new Float32Array(blobs.buffer, blobs.offset + values.offset, values.length / 4);
+            // the viewer expects arrays, and arrays of 3 or 4 numbers for "t" and "q"
+            const width = { t: 3, q: 4 }[action];
+            if (width === undefined) {
+                return [path, action, Array.from(times), Array.from(values)];
+            }
+            const vectors = new Array(times.length);
+            for (let i = 0, j = 0; i < times.length; i++, j += width) {
+                vectors[i] = width === 3
+                    ? [values[j], values[j + 1], values[j + 2]]
+                    : [values[j], values[j + 1], values[j + 2], values[j + 3]];
+            }
+            return [path, action, Array.from(times), vectors];
         }
 
         function nc(change) {
@@ -238,6 +359,87 @@ export function template() {
             );
         }
 
+        function patch(shapes, states, remove, clear, config) {
+            // Apply an incremental update to the scene the viewer already holds
+            if (clear || _shapes === null) {
+                _shapes = { parts: [], loc: [[0, 0, 0], [0, 0, 0, 1]], name: "Group", id: "/Group" };
+                _states = {};
+            } else {
+                const isRemoved = (id) => remove.some((r) => id === r || id.startsWith(r + "/"));
+                _shapes.parts = _shapes.parts.filter((part) => !isRemoved(part.id));
+                for (const key of Object.keys(_states)) {
+                    if (isRemoved(key)) {
+                        delete _states[key];
+                    }
+                }
+            }
+            _shapes.parts.push(...shapes.parts);
+            Object.assign(_states, states);
+            _shapes.bb = shapes.bb;
+
+            render(_shapes, _states, config);
+        }
+
+        function reconfigure(config) {
+            // Apply new viewer settings to the scene the viewer already holds, see show_config
+            const current = Object.assign({}, _config, { reset_camera: false }, config);
+            // explicitly set camera settings win over the camera of the user
+            if (config.zoom !== undefined) {
+                _zoom = null;
+            }
+            if (config.position !== undefined) {
+                _position = null;
+            }
+            if (config.quaternion !== undefined) {
+                _quaternion = null;
+            }
+            if (config.target !== undefined) {
+                _target = null;
+            }
+            if (_states === null) {
+                _config = current;
+                return;
+            }
+            if (config.render_edges !== undefined) {
+                // [faces, edges], 3 means the object has none
+                for (const state of Object.values(_states)) {
+                    if (state[0] !== 3 && state[1] !== 3) {
+                        state[1] = config.render_edges ? 1 : 0;
+                    }
+                }
+            }
+            render(_shapes, _states, current);
+        }
+
+        function refine(meshes, ids) {
+            // Replace the meshes of the leaves referencing refined instances, see lod.py
+            if (_shapes === null) {
+                return;
+            }
+            const leaves = {};
+            (function walk(obj) {
+                if (obj.parts !== undefined) {
+                    obj.parts.forEach(walk);
+                } else {
+                    leaves[obj.id] = obj;
+                }
+            })(_shapes);
+
+            meshes.forEach((mesh, i) => {
+                for (const id of ids[i]) {
+                    if (leaves[id] !== undefined) {
+                        leaves[id].shape = mesh;
+                    }
+                }
+            });
+
+            // keep the camera of the user
+            const reset = _config.reset_camera;
+            _config.reset_camera = false;
+            render(_shapes, _states, _config);
+            _config.reset_camera = reset;
+        }
+
         showViewer();
         
         window.addEventListener('resize', function(event) {
@@ -253,30 +455,80 @@ export function template() {
         }, true);
         console.log("resize listener registered");
 
+        function parse(message) {
+            if (typeof message === "string") {
+                return [JSON.parse(message), undefined];
+            }
+            const bytes = (message instanceof ArrayBuffer)
+                ? new Uint8Array(message)
+                : new Uint8Array(message.buffer, message.byteOffset, message.byteLength);
+            if (new TextDecoder().decode(bytes.subarray(0, 4)) === "OCPB") {
+                return fromBinary(bytes);
+            }
+            return [JSON.parse(new TextDecoder().decode(bytes)), undefined];
+        }
+
         window.addEventListener('message', event => {
-            var data = JSON.parse(event.data);
+            var message = event.data;
+            var id = null;
+            var cached = {};
+            if (message.body !== undefined) {
+                // model forwarded by the command server, see controller.ts
+                id = message.id;
+                cached = message.cached || {};
+                message = message.body;
+            }
 
-            if (data.type === "data") {
-                decode(data);
+            const start = performance.now();
+            const [data, blobs] = parse(message);
+            var meshes;
+            if (data.type === "data" || data.type === "update" || data.type === "refine") {
+                meshes = decode(data, blobs, cached);
+            }
+            const decoded = performance.now();
 
+            if (data.type === "data") {
                 let meshData = data.data;
                 let config = data.config;
                 render(meshData.shapes, meshData.states, config);
 
+            } else if (data.type === "update") {
+                let meshData = data.data;
+                patch(meshData.shapes, meshData.states, data.remove, data.clear, data.config);
+
+            } else if (data.type === "refine") {
+                refine(meshes, data.data.ids);
+
+            } else if (data.type === "config") {
+                reconfigure(data.config);
+
             } else if (data.type === "animation") {
-                const tracks = data.data;
+                const tracks = data.data.map((track) => decodeTrack(track, blobs));
+                let duration = 0;
                 for (var track of tracks) {
                     viewer.addAnimationTrack(...track);
+                    for (const time of track[2]) {
+                        duration = Math.max(duration, time);
+                    }
                 }
-                const duration = Math.max(
-                    ...tracks.map((track) => Math.max(...track[2]))
-                );
                 if (data.config.speed > 0) {
                       viewer.initAnimation(duration, data.config.speed);
                 }
             }
+
+            if (id !== null) {
+                vscode.postMessage({
+                    command: "timings",
+                    id: id,
+                    decode: decoded - start,
+                    render: performance.now() - decoded
+                });
+            }
         });
         console.log("message listener registered");
+
+        // a re-created webview gets the last scene again, see controller.ts
+        vscode.postMessage({ command: "ready" });
         
     </script>
 </head>
@@ -258,6 +258,40 @@ export async function activate(context: vscode.ExtensionContext) {
         })
     );
 
+    context.subscriptions.push(
+        vscode.commands.registerCommand(
+            "ocpCadViewer.openScene",
+            async (uri?: vscode.Uri) => {
+                if (uri === undefined) {
+                    const uris = await vscode.window.showOpenDialog({
+                        canSelectMany: false,
+                        filters: { "OCP CAD Viewer scene": ["ocpb"] }
+                    });
+                    if (uris === undefined || uris.length === 0) {
+                        return;
+                    }
+                    uri = uris[0];
+                }
+
+                // no Python process needed, the viewer only gets started
+                if (!CadqueryViewer.controller?.isStarted()) {
+                    controller = new CadqueryController(context, 3939, statusManager);
+                    if (!controller.isStarted()) {
+                        vscode.window.showErrorMessage(
+                            "Port 3939 in use, start the viewer with 'OCP CAD Viewer: Open viewer' first"
+                        );
+                        return;
+                    }
+                    statusManager.refresh("3939");
+                }
+
+                const body = await vscode.workspace.fs.readFile(uri);
+                output.info(`Loading scene ${uri.fsPath}`);
+                CadqueryViewer.controller?.loadScene(body);
+            }
+        )
+    );
+
     context.subscriptions.push(
         vscode.commands.registerCommand(
             "ocpCadViewer.restartIpython",
@@ -302,7 +336,7 @@ export async function activate(context: vscode.ExtensionContext) {
                 ];
             libraryManager.refresh(pythonPath);
             controller.dispose();
-            CadqueryViewer.currentPanel?.dispose();
+            CadqueryViewer.disposeAll();
         }
     });
 
@@ -312,11 +346,11 @@ export async function activate(context: vscode.ExtensionContext) {
         let pythonPath = extension.exports.settings.getExecutionDetails().execCommand[0];
         libraryManager.refresh(pythonPath);
         controller.dispose();
-        CadqueryViewer.currentPanel?.dispose();
+        CadqueryViewer.disposeAll();
     });
 }
 
 export function deactivate() {
     output.debug("OCP CAD Viewer extension deactivated");
-    CadqueryViewer.currentPanel?.dispose();
+    CadqueryViewer.disposeAll();
 }
@@ -19,12 +19,15 @@ import { template } from "./display";
 import { CadqueryController } from "./controller";
 import * as output from "./output";
 
+export const DEFAULT_SESSION = "";
+
 export class CadqueryViewer {
     /**
-     * Track the currently panel. Only allow a single panel to exist at a time.
+     * Track the panels, one per session. Python scripts that do not name a
+     * session use the default panel.
      */
 
-    public static currentPanel: CadqueryViewer | undefined;
+    public static panels = new Map<string, CadqueryViewer>();
     public static controller: CadqueryController | undefined;
 
     public static readonly viewType = "cadqueryViewer";
@@ -32,35 +35,41 @@ export class CadqueryViewer {
     private readonly _panel: vscode.WebviewPanel;
     private _disposables: vscode.Disposable[] = [];
 
+    public static get currentPanel(): CadqueryViewer | undefined {
+        return CadqueryViewer.panels.get(DEFAULT_SESSION);
+    }
+
     public static createOrShow(
         extensionUri: vscode.Uri,
-        _controller: CadqueryController
+        _controller: CadqueryController,
+        session: string = DEFAULT_SESSION
     ) {
         this.controller = _controller;
 
-        if (CadqueryViewer.currentPanel) {
+        const current = CadqueryViewer.panels.get(session);
+        if (current) {
             // If we already have a panel, show it.
 
             output.debug("Revealing existing webview panel");
 
-            CadqueryViewer.currentPanel._panel.reveal(vscode.ViewColumn.Two);
+            current._panel.reveal(vscode.ViewColumn.Two);
         } else {
             // Otherwise, create a new panel.
 
-            output.debug("Creating new webview panel");
+            output.debug(`Creating new webview panel for session "${session}"`);
 
             const panel = vscode.window.createWebviewPanel(
                 CadqueryViewer.viewType,
-                "OCP CAD Viewer",
+                CadqueryViewer.title(session),
                 vscode.ViewColumn.Two,
                 {
                     enableScripts: true,
                     retainContextWhenHidden: true
                 }
             );
-            CadqueryViewer.currentPanel = new CadqueryViewer(
-                panel,
-                extensionUri
+            CadqueryViewer.panels.set(
+                session,
+                new CadqueryViewer(panel, extensionUri, session)
             );
         }
     }
@@ -68,10 +77,27 @@ export class CadqueryViewer {
     public static revive(panel: vscode.WebviewPanel, extensionUri: vscode.Uri) {
         output.debug("Reviving webview panel");
 
-        CadqueryViewer.currentPanel = new CadqueryViewer(panel, extensionUri);
+        CadqueryViewer.panels.set(
+            DEFAULT_SESSION,
+            new CadqueryViewer(panel, extensionUri, DEFAULT_SESSION)
+        );
+    }
+
+    public static disposeAll() {
+        for (const panel of [...CadqueryViewer.panels.values()]) {
+            panel.dispose();
+        }
     }
 
-    private constructor(panel: vscode.WebviewPanel, extensionUri: vscode.Uri) {
+    private static title(session: string): string {
+        return session === DEFAULT_SESSION ? "OCP CAD Viewer" : `OCP CAD Viewer (${session})`;
+    }
+
+    private constructor(
+        panel: vscode.WebviewPanel,
+        extensionUri: vscode.Uri,
+        public readonly session: string
+    ) {
         this._panel = panel;
 
         this._panel.onDidDispose(() => this.dispose(), null, this._disposables);
@@ -97,6 +123,12 @@ export class CadqueryViewer {
                     case "alert":
                         vscode.window.showErrorMessage(message.text);
                         return;
+                    case "timings":
+                        CadqueryViewer.controller?.reportTimings(message);
+                        return;
+                    case "ready":
+                        CadqueryViewer.controller?.replay(this.session);
+                        return;
                 }
             },
             null,
@@ -106,7 +138,9 @@ export class CadqueryViewer {
 
     public dispose() {
         output.debug("CadqueryViewer dispose");
-        CadqueryViewer.currentPanel = undefined;
+        if (CadqueryViewer.panels.get(this.session) === this) {
+            CadqueryViewer.panels.delete(this.session);
+        }
 
         this._panel.dispose();
 
@@ -116,14 +150,17 @@ export class CadqueryViewer {
                 x.dispose();
             }
         }
-        CadqueryViewer.controller?.dispose();
+        // the command server stops with the last panel
+        if (CadqueryViewer.panels.size === 0) {
+            CadqueryViewer.controller?.dispose();
+        }
     }
 
     public update(div: string) {
         if (div !== "") {
             output.debug("Updateing webview");
             const webview = this._panel.webview;
-            this._panel.title = "OCP CAD Viewer";
+            this._panel.title = CadqueryViewer.title(this.session);
             webview.html = div;
         }
     }
@@ -0,0 +1,62 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import cadquery as cq
+from ocp_tessellate.tessellator import cache
+
+from ocp_vscode.disk_cache import disable_disk_cache, enable_disk_cache
+from ocp_vscode.show import _tessellate
+
+
+def _scene():
+    # a small sphere next to a large plate, both plain workplanes
+    return (
+        cq.Workplane().box(200, 200, 2),
+        cq.Workplane().sphere(2).translate((0, 0, 10)),
+    )
+
+
+def _triangles(**kwargs):
+    instances, _, _, _, _ = _tessellate(*_scene(), progress=None, **kwargs)
+    return sum(len(mesh["triangles"]) // 3 for mesh in instances)
+
+
+def test_adaptive_coarsens_workplanes():
+    cache.clear()
+    assert _triangles(adaptive=True) < _triangles(adaptive=False)
+
+
+def test_adaptive_with_disk_cache(tmp_path):
+    enable_disk_cache(str(tmp_path))
+    try:
+        cache.clear()
+        triangles = _triangles(adaptive=True, triangle_budget=1000)
+        entries = len(os.listdir(tmp_path))
+        assert entries > 0
+
+        # a second run gets the adapted meshes from disk
+        cache.clear()
+        assert _triangles(adaptive=True, triangle_budget=1000) == triangles
+        assert len(os.listdir(tmp_path)) == entries
+
+        # meshes of other tolerances do not collide with the adapted ones
+        cache.clear()
+        assert _triangles(adaptive=False) > triangles
+        assert len(os.listdir(tmp_path)) > entries
+    finally:
+        disable_disk_cache()
@@ -0,0 +1,77 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import cadquery as cq
+from ocp_tessellate.tessellator import cache
+
+from ocp_vscode.parallel import shutdown_pool
+from ocp_vscode.profile import Profile
+from ocp_vscode.show import _tessellate
+
+
+class Marks:
+    """Progress that records the marks instead of printing them"""
+
+    def __init__(self):
+        self.marks = ""
+
+    def update(self, mark="+"):
+        self.marks += mark
+
+
+def _marks(*objs, **kwargs):
+    progress = Marks()
+    _tessellate(*objs, progress=progress, **kwargs)
+    return progress.marks
+
+
+def test_dedup_assembly_hits_cache():
+    bolt = cq.Workplane().polygon(6, 2).extrude(1).faces(">Z").circle(0.5).extrude(5)
+    assy = cq.Assembly(name="assy")
+    for i in range(5):
+        assy.add(bolt, name=f"bolt{i}", loc=cq.Location(cq.Vector(5 * i, 0, 0)))
+    assy.add(cq.Workplane().sphere(3), name="sphere")
+
+    cache.clear()
+    assert "c" not in _marks(assy)
+    assert "+" not in _marks(assy)
+
+
+def test_show_twice_hits_cache():
+    objs = (
+        cq.Workplane().sphere(2),
+        # parts of several solids and faces become compounds
+        cq.Workplane().pushPoints([(0, 0), (5, 5)]).box(1, 1, 1),
+        cq.Workplane().box(1, 1, 1).faces(),
+    )
+
+    cache.clear()
+    assert _marks(*objs) == "+++"
+    assert _marks(*objs) == "ccc"
+
+
+def test_parallel_show_twice_sends_no_jobs():
+    objs = [cq.Workplane().sphere(1 + i).translate((5 * i, 0, 0)) for i in range(4)]
+
+    cache.clear()
+    try:
+        first, second = Profile(), Profile()
+        _tessellate(*objs, progress=Marks(), profile=first, parallel=True)
+        _tessellate(*objs, progress=Marks(), profile=second, parallel=True)
+    finally:
+        shutdown_pool()
+    assert first.pool == 4
+    assert second.pool == 0